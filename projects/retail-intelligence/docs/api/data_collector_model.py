@@ -1,21 +1,24 @@
+import asyncio
+import base64
+import json
 import logging
+import threading
 import time
 from datetime import datetime, timedelta
 from datetime import time as dt_time  # Import necessário para comparar os horários
 from datetime import timezone
-from sqlalchemy import create_engine, text, and_
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 from core.models import SaleData, PeopleCountingData, HeatmapData, LastUpdate, AnalyticsResults, RegionalPeopleCountingData
 from core.config import DATABASE_URL
 from conector.autenticar import autenticar
 from conector.consultar import consultar_vendas
-from tenacity import retry, wait_fixed, stop_after_attempt
+from tenacity import retry, retry_if_exception_type, wait_exponential_jitter, stop_after_attempt
 import pandas as pd
 from io import StringIO
-import requests
+import httpx
 import schedule
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import traceback
 import subprocess
 
 # Configuração do logger
@@ -26,6 +29,43 @@ logger = logging.getLogger(__name__)
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
 
+# Inserção em massa: registros por lote (um executemany por lote)
+TAMANHO_LOTE = 500
+
+# Chaves únicas de cada tabela; a deduplicação é feita pelo próprio banco
+# (INSERT ... ON CONFLICT DO NOTHING sobre um índice único nestas colunas)
+CHAVES_UNICAS = {
+    SaleData: ('referencia_documento', 'item', 'data'),
+    PeopleCountingData: ('start_time', 'loja', 'ip'),
+    HeatmapData: ('start_time', 'loja', 'ip'),
+    RegionalPeopleCountingData: ('start_time', 'loja', 'ip'),
+}
+
+# Coleta das câmaras: todas as lojas e tipos de relatório em paralelo, com
+# conexões keep-alive partilhadas e no máximo MAX_PEDIDOS_POR_CAMARA pedidos
+# simultâneos por câmara (são equipamentos frágeis)
+MAX_PEDIDOS_POR_CAMARA = 2
+MAX_CONEXOES = 32
+TIMEOUT_CAMARA = httpx.Timeout(30.0, connect=5.0)
+TENTATIVAS_CAMARA = 4
+
+# Janelas dos relatórios: cada pedido cobre até JANELA_MAXIMA_HORAS horas;
+# se um relatório longo falhar ou vier truncado, a janela passa para metade
+# (no limite, uma hora)
+JANELA_MAXIMA_HORAS = 24
+TENTATIVAS_JANELA_LONGA = 2
+
+# API de vendas: um pedido por loja e dia, todas as lojas em paralelo, com
+# no máximo VENDAS_PEDIDOS_POR_SEGUNDO pedidos por segundo e
+# MAX_PEDIDOS_VENDAS em curso no total; o JWT é partilhado e renovado
+# MARGEM_TOKEN segundos antes de expirar (VALIDADE_TOKEN_PADRAO se o token
+# não disser quando expira)
+VENDAS_PEDIDOS_POR_SEGUNDO = 2
+MAX_PEDIDOS_VENDAS = 4
+TENTATIVAS_VENDAS = 5
+VALIDADE_TOKEN_PADRAO = 30 * 60
+MARGEM_TOKEN = 60
+
 # URLs das lojas (removendo OML01-Omnia GuimarãesShopping)
 stores = {
     "OML01-Omnia GuimarãesShopping": ["93.108.96.96:21001"],
@@ -55,190 +95,363 @@ def get_jwt_token():
         logger.error(f"Erro ao obter token JWT: {str(e)}", exc_info=True)
         raise
 
+def expiracao_jwt(token):
+    """Instante (time.time()) em que o JWT expira, lido do campo exp, ou None"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
+        return None
+
+class TokenVendas:
+    """
+    JWT da API de vendas partilhado por todas as lojas e coletas
+
+    É obtido uma vez e reutilizado até perto de expirar. Um pedido que falhe
+    invalida o token com que foi feito, e a tentativa seguinte autentica de
+    novo (uma única vez, mesmo que vários pedidos falhem ao mesmo tempo).
+    """
+
+    def __init__(self):
+        self._token = None
+        self._renovar_em = 0.0
+        self._lock = threading.Lock()
+
+    def obter(self):
+        with self._lock:
+            if self._token is None or time.time() >= self._renovar_em:
+                token = get_jwt_token()
+                expira = expiracao_jwt(token) or time.time() + VALIDADE_TOKEN_PADRAO
+                self._token, self._renovar_em = token, expira - MARGEM_TOKEN
+            return self._token
+
+    def invalidar(self, token):
+        with self._lock:
+            if token == self._token:
+                self._token = None
+
+token_vendas = TokenVendas()
+
+class LimiteTaxa:
+    """No máximo `por_segundo` pedidos por segundo e `simultaneos` em curso, somando todas as lojas"""
+
+    def __init__(self, por_segundo, simultaneos):
+        self.intervalo = 1 / por_segundo
+        self._proximo = 0.0
+        self._vagas = asyncio.Semaphore(simultaneos)
+
+    async def __aenter__(self):
+        await self._vagas.acquire()
+        agora = time.monotonic()
+        espera = self._proximo - agora
+        self._proximo = max(agora, self._proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    async def __aexit__(self, *exc):
+        self._vagas.release()
+
 # Função para coletar dados de vendas, incluindo tratamento para erros da API
-@retry(wait=wait_fixed(10), stop=stop_after_attempt(5))
-def consultar_vendas_com_retry(jwt_token, data, loja):
+@retry(wait=wait_exponential_jitter(initial=2, max=60), stop=stop_after_attempt(TENTATIVAS_VENDAS), reraise=True)
+async def consultar_vendas_com_retry(limite, data, loja):
+    jwt_token = await asyncio.to_thread(token_vendas.obter)
     try:
-        return consultar_vendas(jwt_token, data, loja)
+        async with limite:
+            return await asyncio.to_thread(consultar_vendas, jwt_token, data, loja)
     except Exception as e:
         logger.error(f"Erro na API ao consultar vendas para {loja} na data {data}: {str(e)}", exc_info=True)
+        # Pode ser o token expirado ou revogado: a próxima tentativa autentica de novo
+        token_vendas.invalidar(jwt_token)
         raise
 
-def coletar_dados_vendas(jwt_token, inicio, fim, loja):
-    dados = []
-    data_atual = inicio
-    total_erros = 0  # Contador de erros
+def dias_de_vendas(inicio, fim):
+    """Dias em que a janela tem alguma hora a partir das 09:00 (antes disso não há vendas a consultar)"""
+    dias = []
+    atual = inicio.astimezone(timezone.utc)
+    while atual < fim:
+        if atual.hour >= 9 and atual.date() not in dias:
+            dias.append(atual.date())
+        atual += timedelta(hours=1)
+    return dias
+
+async def coletar_dados_vendas(limite, dia, loja):
+    """Todas as vendas de um dia de uma loja, numa só consulta"""
+    consulta_data = await consultar_vendas_com_retry(limite, dia.strftime('%Y-%m-%d'), loja)
+    if not consulta_data.get('Sucesso'):
+        logger.warning(f"API de vendas não retornou dados para {loja} na data {dia}.")
+        return []
+    result_sets = consulta_data['Objecto']['ResultSets']
+    return list(result_sets[0] or []) if result_sets else []
+
+async def coletar_e_armazenar_dados_vendas(limite, escrita, loja, inicio, fim):
+    """Consulta cada dia da janela uma vez; retorna o número de dias que falharam"""
+    async def coletar_dia(dia):
+        dados = await coletar_dados_vendas(limite, dia, loja)
+        if not dados:
+            logger.warning(f"Sem dados de vendas para {loja} em {dia}")
+            return
+        logger.info(f"{len(dados)} vendas para {loja} em {dia}")
+        async with escrita:
+            await asyncio.to_thread(armazenar_dados_no_banco, dados, SaleData)
+
+    dias = dias_de_vendas(inicio, fim)
+    resultados = await asyncio.gather(*(coletar_dia(dia) for dia in dias), return_exceptions=True)
+    total_erros = 0
+    for dia, resultado in zip(dias, resultados):
+        if isinstance(resultado, Exception):
+            total_erros += 1
+            logger.error(f"Erro ao coletar ou armazenar vendas para {loja} em {dia}: {str(resultado)}", exc_info=resultado)
+    if total_erros > 0:
+        logger.warning(f"Falhas na coleta de vendas para {loja}: {total_erros} dias com erro no período de {inicio} a {fim}")
+    return total_erros
 
-    while data_atual < fim:
+async def coletar_dados_vendas_lojas(janelas):
+    """
+    Vendas de todas as lojas em paralelo, sob um limite global de pedidos;
+    `janelas` é {loja: (inicio, fim)}. Retorna o número de dias falhados por loja.
+    """
+    limite = LimiteTaxa(VENDAS_PEDIDOS_POR_SEGUNDO, MAX_PEDIDOS_VENDAS)
+    escrita = asyncio.Lock()
+    lojas = list(janelas)
+    resultados = await asyncio.gather(
+        *(coletar_e_armazenar_dados_vendas(limite, escrita, loja, *janelas[loja]) for loja in lojas),
+        return_exceptions=True
+    )
+    erros = {}
+    for loja, resultado in zip(lojas, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"Erro ao coletar e armazenar dados de vendas para {loja}: {str(resultado)}", exc_info=resultado)
+            resultado = 1
+        erros[loja] = resultado
+        if resultado == 0:
+            logger.info(f"Todos os dados de vendas foram atualizados com sucesso para {loja}.")
+        else:
+            logger.info(f"Dados de vendas foram atualizados com {resultado} erros para {loja}.")
+    return erros
+
+class ErroRelatorioCamara(Exception):
+    """Resposta da câmara que vale a pena pedir de novo (5xx, 429)"""
+
+@retry(
+    wait=wait_exponential_jitter(initial=1, max=20),
+    stop=stop_after_attempt(TENTATIVAS_CAMARA),
+    retry=retry_if_exception_type((httpx.TransportError, ErroRelatorioCamara)),
+    reraise=True
+)
+async def buscar_relatorio_camara(client, url, limite):
+    # O limite por câmara só é ocupado durante o pedido, não durante a espera entre tentativas
+    async with limite:
+        response = await client.get(url)
+    if response.status_code >= 500 or response.status_code == 429:
+        raise ErroRelatorioCamara(f"HTTP {response.status_code}")
+    response.raise_for_status()
+    return response.text
+
+class ErroJanelaCamara(Exception):
+    """Relatório de várias horas inutilizável (truncado ou agregado); a janela é dividida"""
+
+def relatorio_truncado(texto):
+    """Resposta cortada a meio: a última linha não tem as colunas do cabeçalho"""
+    linhas = [linha for linha in texto.splitlines() if linha.strip()]
+    return len(linhas) > 1 and linhas[-1].count(',') != linhas[0].count(',')
+
+def linhas_por_hora(registros, inicio, fim):
+    """
+    Registros de um relatório de várias horas que caem na janela, um por
+    hora como nos pedidos de uma hora. Um registro que cubra mais de uma
+    hora significa que a câmara agregou o período: a janela tem de ser
+    pedida em partes menores.
+    """
+    if not registros:
+        return registros
+    df = pd.DataFrame(registros)
+    if ((df['end_time'] - df['start_time']) > timedelta(hours=1)).any():
+        raise ErroJanelaCamara("a câmara agregou o período em vez de o dividir por hora")
+    dentro = (df['end_time'] > inicio.replace(tzinfo=None)) & (df['start_time'] < fim.replace(tzinfo=None))
+    return para_registros(df[dentro])
+
+async def buscar_registros(client, limite, url, parse_function, loja, ip, inicio, fim):
+    longa = fim - inicio > timedelta(hours=1)
+    if not longa:
+        return parse_function(await buscar_relatorio_camara(client, url, limite), loja, ip)
+
+    # Um relatório longo que falha vai ser dividido; não vale a pena insistir nele
+    buscar = buscar_relatorio_camara.retry_with(stop=stop_after_attempt(TENTATIVAS_JANELA_LONGA))
+    texto = await buscar(client, url, limite)
+    if relatorio_truncado(texto):
+        raise ErroJanelaCamara("relatório truncado")
+    registros = parse_function(texto, loja, ip)
+    if not registros and len(texto.strip().splitlines()) > 1:
+        raise ErroJanelaCamara("relatório ilegível")
+    return linhas_por_hora(registros, inicio, fim)
+
+async def coletar_relatorio(client, limite, escrita, loja, ip, relatorio, inicio, fim):
+    """
+    Recolhe um tipo de relatório de uma câmara de inicio a fim, em janelas de
+    tamanho adaptativo; retorna o número de janelas de uma hora que falharam
+
+    Depois de uma falha, a janela não volta a crescer além do tamanho que
+    funcionou, para não repetir pedidos que a câmara não aguenta.
+    """
+    data_type, parse_function, model = relatorio
+    horas = maximo = JANELA_MAXIMA_HORAS
+    falhas = 0
+    atual = inicio
+    while atual < fim:
+        proximo = min(atual + timedelta(hours=horas), fim)
+        duracao = (proximo - atual) / timedelta(hours=1)
+        url = url_camara(ip, data_type, atual, proximo)
         try:
-            consulta_data = consultar_vendas_com_retry(jwt_token, data_atual.strftime('%Y-%m-%d'), loja)
-            logger.info(f"Resposta da consulta de vendas para a data {data_atual} e loja {loja}: {consulta_data}")
-            if consulta_data.get('Sucesso'):
-                result_sets = consulta_data['Objecto']['ResultSets']
-                if result_sets:
-                    first_result_set = result_sets[0]
-                    if first_result_set:
-                        dados.extend(first_result_set)
-            else:
-                logger.warning(f"API de vendas não retornou dados para {loja} na data {data_atual}.")
+            registros = await buscar_registros(client, limite, url, parse_function, loja, ip, atual, proximo)
         except Exception as e:
-            error_message = str(e)
-            stack_trace = traceback.format_exc()
-            log_error_to_db(loja, data_atual, error_message, stack_trace)  # type: ignore # Log de erro detalhado
-            total_erros += 1
-            logger.error(f"Erro ao consultar vendas para {loja} na data {data_atual}: {str(e)}", exc_info=True)
-        finally:
-            data_atual += timedelta(hours=1)
+            if duracao > 1:
+                horas = maximo = max(1, int(duracao // 2))
+                logger.warning(f"Janela de {duracao:g}h falhou para a URL: {url} ({str(e)}); tentando janelas de {horas}h")
+                continue
+            falhas += 1
+            logger.error(f"Erro ao processar os dados da URL: {url} - {str(e)}", exc_info=True)
+        else:
+            if registros:
+                # Uma escrita de cada vez: o SQLite não aceita escritores concorrentes
+                async with escrita:
+                    await asyncio.to_thread(armazenar_dados_no_banco, registros, model)
+                logger.info(f"Dados armazenados no banco de dados com sucesso para a URL: {url}")
+            else:
+                logger.warning(f"Nenhum dado processado para a URL: {url}")
+            horas = min(maximo, horas * 2)
+        atual = proximo
+    return falhas
+
+# Câmaras cujo heatmap vem multiplicado por 10
+CAMARAS_HEATMAP_X10 = {
+    "62.48.154.135:21001",
+    "62.48.154.135:21002",
+    "93.108.96.96:21001"
+}
 
-    if total_erros > 0:
-        logger.warning(f"Falhas na coleta de vendas para {loja}: {total_erros} erros no período de {inicio} a {fim}")
+FORMATO_DATA_CONTAGEM = '%Y/%m/%d %H:%M:%S'
+FORMATO_DATA_HEATMAP = '%Y-%m-%d %H:%M:%S'
 
-    return [dict(t) for t in {tuple(d.items()) for d in dados}]
+def ler_csv_camara(text):
+    df = pd.read_csv(StringIO(text))
+    df.columns = [col.strip() for col in df.columns]
+    return df
 
-def coletar_e_armazenar_dados_vendas(loja, inicio, fim):
-    try:
-        jwt_token = get_jwt_token()
-    except Exception as e:
-        logger.error(f"Erro ao obter token JWT para {loja}: {str(e)}", exc_info=True)
-        return 1  # Conta como um erro
+def para_registros(df):
+    """
+    DataFrame -> lista de dicionários para armazenar_dados_no_banco, com
+    tipos nativos do Python (int, float, datetime) em vez de tipos NumPy
+    """
+    return df.astype(object).to_dict('records')
 
-    current_time = inicio.astimezone(timezone.utc)
-    total_erros = 0
-    while current_time < fim:
-        next_time = current_time + timedelta(hours=1)
-        if current_time.hour >= 0 and current_time.hour < 9:
-            current_time = next_time
-            continue
-        logger.info(f"Coletando dados para {loja} de {current_time} a {next_time}")
-        try:
-            todos_dados = coletar_dados_vendas(jwt_token, current_time, next_time, loja)
-            if todos_dados:
-                armazenar_dados_no_banco(todos_dados, SaleData)
-                logger.info(f"Dados de vendas armazenados com sucesso para {loja} de {current_time} a {next_time}")
-            else:
-                logger.warning(f"Sem dados para {loja} de {current_time} a {next_time}")
-        except Exception as e:
-            total_erros += 1
-            logger.error(f"Erro ao coletar ou armazenar dados para {loja} de {current_time} a {next_time}: {str(e)}", exc_info=True)
-        current_time = next_time
-    return total_erros
-
-def fetch_and_store(url, parse_function, model, loja, ip):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = parse_function(response.text, loja, ip)
-        # Convert objects to dictionaries e remove SQLAlchemy internal attributes
-        data_dicts = [{k: v for k, v in d.__dict__.items() if k != '_sa_instance_state'} for d in data]
-        if data_dicts:
-            armazenar_dados_no_banco(data_dicts, model)
-            logger.info(f"Dados armazenados no banco de dados com sucesso para a URL: {url}")
-        else:
-            logger.warning(f"Nenhum dado processado para a URL: {url}")
-    except Exception as e:
-        logger.error(f"Erro ao processar os dados da URL: {url} - {str(e)}", exc_info=True)
-        raise
+def colunas_inteiras(df, colunas):
+    return df[colunas].astype('int64')
 
 def parse_people_counting_data(text, loja, ip):
     try:
-        df = pd.read_csv(StringIO(text))
-        df.columns = [col.strip() for col in df.columns]
-        data = [
-            PeopleCountingData(
-                loja=loja,
-                ip=ip,
-                start_time=datetime.strptime(row['StartTime'], '%Y/%m/%d %H:%M:%S'),
-                end_time=datetime.strptime(row['EndTime'], '%Y/%m/%d %H:%M:%S'),
-                total_in=int(row['Line1 - In']) + int(row['Line2 - In']) + int(row['Line3 - In']),
-                line1_in=int(row['Line1 - In']),
-                line2_in=int(row['Line2 - In']),
-                line3_in=int(row['Line3 - In']),
-                line4_in=int(row['Line4 - In']),
-                line4_out=int(row['Line4 - Out'])  # Adicionando line4_out
-            )
-            for index, row in df.iterrows()
-        ]
-        return data
+        df = ler_csv_camara(text)
+        linhas = colunas_inteiras(df, ['Line1 - In', 'Line2 - In', 'Line3 - In', 'Line4 - In', 'Line4 - Out'])
+        registros = pd.DataFrame({
+            'loja': loja,
+            'ip': ip,
+            'start_time': pd.to_datetime(df['StartTime'], format=FORMATO_DATA_CONTAGEM),
+            'end_time': pd.to_datetime(df['EndTime'], format=FORMATO_DATA_CONTAGEM),
+            'total_in': linhas[['Line1 - In', 'Line2 - In', 'Line3 - In']].sum(axis=1),
+            'line1_in': linhas['Line1 - In'],
+            'line2_in': linhas['Line2 - In'],
+            'line3_in': linhas['Line3 - In'],
+            'line4_in': linhas['Line4 - In'],
+            'line4_out': linhas['Line4 - Out']
+        })
+        return para_registros(registros)
     except Exception as e:
         logger.error(f"Erro ao analisar os dados de contagem de pessoas: {str(e)}", exc_info=True)
         return []
 
 def parse_heatmap_data(text, loja, ip):
     try:
-        # Lista de câmaras específicas
-        camaras_especificas = [
-            "62.48.154.135:21001",
-            "62.48.154.135:21002",
-            "93.108.96.96:21001"
-        ]
-
-        df = pd.read_csv(StringIO(text))
-        df.columns = [col.strip() for col in df.columns]
-        data = [
-            HeatmapData(
-                loja=loja,
-                ip=ip,
-                start_time=datetime.strptime(row['StartTime'], '%Y-%m-%d %H:%M:%S'),
-                end_time=datetime.strptime(row['EndTime'], '%Y-%m-%d %H:%M:%S'),
-                # Dividir por 10 apenas para as câmaras específicas
-                value=int(row['Value(s)']) / 10 if ip in camaras_especificas else int(row['Value(s)'])
-            )
-            for index, row in df.iterrows()
-        ]
-        return data
+        df = ler_csv_camara(text)
+        valores = df['Value(s)'].astype('int64')
+        registros = pd.DataFrame({
+            'loja': loja,
+            'ip': ip,
+            'start_time': pd.to_datetime(df['StartTime'], format=FORMATO_DATA_HEATMAP),
+            'end_time': pd.to_datetime(df['EndTime'], format=FORMATO_DATA_HEATMAP),
+            # Dividir por 10 apenas para as câmaras específicas
+            'value': valores / 10 if ip in CAMARAS_HEATMAP_X10 else valores
+        })
+        return para_registros(registros)
     except Exception as e:
         logger.error(f"Erro ao analisar os dados de heatmap: {str(e)}", exc_info=True)
         return []
 
 def parse_regional_people_counting_data(text, loja, ip):
     try:
-        df = pd.read_csv(StringIO(text))
-        df.columns = [col.strip() for col in df.columns]
-        data = [
-            RegionalPeopleCountingData(
-                loja=loja,
-                ip=ip,
-                start_time=datetime.strptime(row['StartTime'], '%Y/%m/%d %H:%M:%S'),
-                end_time=datetime.strptime(row['EndTime'], '%Y/%m/%d %H:%M:%S'),
-                region1=int(row['region1']),
-                region2=int(row['region2']),
-                region3=int(row['region3']),
-                region4=int(row['region4']),
-                total=int(row['Sum'])
-            )
-            for index, row in df.iterrows()
-        ]
-        return data
+        df = ler_csv_camara(text)
+        regioes = colunas_inteiras(df, ['region1', 'region2', 'region3', 'region4', 'Sum'])
+        registros = pd.DataFrame({
+            'loja': loja,
+            'ip': ip,
+            'start_time': pd.to_datetime(df['StartTime'], format=FORMATO_DATA_CONTAGEM),
+            'end_time': pd.to_datetime(df['EndTime'], format=FORMATO_DATA_CONTAGEM),
+            'region1': regioes['region1'],
+            'region2': regioes['region2'],
+            'region3': regioes['region3'],
+            'region4': regioes['region4'],
+            'total': regioes['Sum']
+        })
+        return para_registros(registros)
     except Exception as e:
         logger.error(f"Erro ao analisar os dados de contagem regional de pessoas: {str(e)}", exc_info=True)
         return []
 
-def generate_urls(start_date, end_date, base_url, data_type):
-    urls = []
-    current_date = start_date
-    while current_date < end_date:
-        url = f"http://admin:grnl.2024@{base_url}/dataloader.cgi?dw={data_type}&time_start={current_date.strftime('%Y-%m-%d-%H:%M:%S')}&time_end={(current_date + timedelta(hours=1)).strftime('%Y-%m-%d-%H:%M:%S')}"
-        urls.append(url)
-        current_date += timedelta(hours=1)
-    return urls
-
-def process_data_for_store_parallel(loja, ips, start_date, end_date, data_type, parse_function, model):
-    if not ips:
-        logger.warning(f"Nenhum IP fornecido para a loja {loja}, pulando processamento.")
-        return
-    with ThreadPoolExecutor(max_workers=len(ips)) as executor:
-        futures = []
-        for ip in ips:
-            base_url = f"{ip}"
-            urls = generate_urls(start_date, end_date, base_url, data_type)
-            for url in urls:
-                futures.append(executor.submit(fetch_and_store, url, parse_function, model, loja, ip))
-
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                logger.error(f"Erro ao tentar obter e armazenar dados: {str(e)}")
+def url_camara(base_url, data_type, inicio, fim):
+    return (f"http://admin:grnl.2024@{base_url}/dataloader.cgi?dw={data_type}"
+            f"&time_start={inicio.strftime('%Y-%m-%d-%H:%M:%S')}&time_end={fim.strftime('%Y-%m-%d-%H:%M:%S')}")
+
+# Relatórios das câmaras: (parâmetro dw=..., parser, modelo)
+RELATORIOS_CAMARA = [
+    ("vcalogcsv&report_type=0&linetype=31&statistics_type=3", parse_people_counting_data, PeopleCountingData),
+    ("heatmapcsv&sub_type=0", parse_heatmap_data, HeatmapData),
+    ("regionalcountlogcsv&report_type=0&lengthtype=0&length=0&region1=1&region2=1&region3=1&region4=1",
+     parse_regional_people_counting_data, RegionalPeopleCountingData),
+]
+
+async def coletar_dados_camaras(janelas):
+    """
+    Recolhe os três relatórios de todas as câmaras de todas as lojas em
+    paralelo; `janelas` é {loja: (inicio, fim)}. Retorna o número de
+    janelas de uma hora falhadas por loja.
+    """
+    limites = {ip: asyncio.Semaphore(MAX_PEDIDOS_POR_CAMARA) for loja in janelas for ip in stores[loja]}
+    escrita = asyncio.Lock()
+    tarefas = []
+    lojas = []
+    limits = httpx.Limits(max_connections=MAX_CONEXOES, max_keepalive_connections=MAX_CONEXOES)
+    async with httpx.AsyncClient(timeout=TIMEOUT_CAMARA, limits=limits) as client:
+        for loja, (start_date, end_date) in janelas.items():
+            if not stores[loja]:
+                logger.warning(f"Nenhum IP fornecido para a loja {loja}, pulando processamento.")
+                continue
+            for ip in stores[loja]:
+                for relatorio in RELATORIOS_CAMARA:
+                    tarefas.append(coletar_relatorio(client, limites[ip], escrita, loja, ip, relatorio, start_date, end_date))
+                    lojas.append(loja)
+        logger.info(f"Coletando {len(tarefas)} relatórios de {len(limites)} câmaras...")
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+
+    erros = {loja: 0 for loja in janelas}
+    for loja, resultado in zip(lojas, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"Erro ao coletar relatórios para {loja}: {str(resultado)}")
+            erros[loja] += 1
+        else:
+            erros[loja] += resultado
+    for loja, total in erros.items():
+        if total:
+            logger.error(f"Erro ao tentar obter e armazenar dados: {total} horas de relatórios falharam para {loja}")
+    return erros
 
 from datetime import timezone
 
@@ -277,50 +490,13 @@ def set_last_update(store, last_update):
 def remover_registros_futuros_e_duplicados():
     session = SessionLocal()
     try:
-        # Remover registros futuros de people_counting_data considerando apenas o start_time
-        session.execute(text("""
-            DELETE FROM people_counting_data
-            WHERE start_time > datetime('now');
-        """))
-        # Remover registros duplicados de people_counting_data considerando start_time, loja e ip
-        session.execute(text("""
-            DELETE FROM people_counting_data
-            WHERE rowid NOT IN (
-                SELECT MIN(rowid)
-                FROM people_counting_data
-                GROUP BY start_time, loja, ip
-            );
-        """))
-
-        # Remover registros futuros de regional_people_counting_data considerando apenas o start_time
-        session.execute(text("""
-            DELETE FROM regional_people_counting_data
-            WHERE start_time > datetime('now');
-        """))
-        # Remover registros duplicados de regional_people_counting_data considerando start_time, loja e ip
-        session.execute(text("""
-            DELETE FROM regional_people_counting_data
-            WHERE rowid NOT IN (
-                SELECT MIN(rowid)
-                FROM regional_people_counting_data
-                GROUP BY start_time, loja, ip
-            );
-        """))
-
-        # Remover registros futuros de heatmap_data considerando apenas o start_time
-        session.execute(text("""
-            DELETE FROM heatmap_data
-            WHERE start_time > datetime('now');
-        """))
-        # Remover registros duplicados de heatmap_data considerando start_time, loja e ip
-        session.execute(text("""
-            DELETE FROM heatmap_data
-            WHERE rowid NOT IN (
-                SELECT MIN(rowid)
-                FROM heatmap_data
-                GROUP BY start_time, loja, ip
-            );
-        """))
+        # Remover registros futuros considerando apenas o start_time; duplicados
+        # (start_time, loja, ip) já são impedidos pelos índices únicos
+        for model in (PeopleCountingData, RegionalPeopleCountingData, HeatmapData):
+            session.execute(text(f"""
+                DELETE FROM {model.__tablename__}
+                WHERE start_time > CURRENT_TIMESTAMP;
+            """))
 
         session.commit()
         logger.info("Registros futuros e duplicados removidos com sucesso.")
@@ -330,27 +506,104 @@ def remover_registros_futuros_e_duplicados():
     finally:
         session.close()
 
-def armazenar_dados_no_banco(dados, model):
-    session = SessionLocal()
+# Remoção dos duplicados já existentes, mantendo a primeira linha de cada
+# chave; cada banco identifica as linhas à sua maneira (rowid / ctid)
+DELETE_DUPLICADOS = {
+    'sqlite': """
+        DELETE FROM {tabela}
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid)
+            FROM {tabela}
+            GROUP BY {colunas}
+        )
+    """,
+    'postgresql': """
+        DELETE FROM {tabela} a
+        USING {tabela} b
+        WHERE a.ctid > b.ctid AND {iguais}
+    """,
+}
+
+indices_garantidos = set()
+indices_lock = threading.Lock()
+
+def garantir_indice_unico(model):
+    """
+    Cria o índice único de CHAVES_UNICAS do modelo, usado pelo ON CONFLICT
+    DO NOTHING; retorna se o índice existe
+
+    Duplicados já existentes são removidos antes (mantendo a primeira linha),
+    senão a criação do índice falharia. Só é feito uma vez por processo.
+    """
+    with indices_lock:
+        if model in indices_garantidos:
+            return True
+        tabela = model.__tablename__
+        colunas = CHAVES_UNICAS[model]
+        try:
+            delete = DELETE_DUPLICADOS[engine.dialect.name]
+        except KeyError:
+            logger.error(f"Deduplicação não suportada para o banco {engine.dialect.name}")
+            return False
+        lista_colunas = ', '.join(colunas)
+        iguais = ' AND '.join(f"a.{coluna} = b.{coluna}" for coluna in colunas)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(delete.format(tabela=tabela, colunas=lista_colunas, iguais=iguais)))
+                conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{tabela}_chave ON {tabela} ({lista_colunas})"))
+            logger.info(f"Índice único garantido para {tabela} ({lista_colunas})")
+        except Exception as e:
+            logger.error(f"Erro ao criar o índice único de {tabela}: {str(e)}", exc_info=True)
+            return False
+        indices_garantidos.add(model)
+        return True
+
+def garantir_indices_unicos():
+    for model in CHAVES_UNICAS:
+        garantir_indice_unico(model)
+
+def insert_ignorando_duplicados(model):
+    """
+    INSERT ... ON CONFLICT (chave única) DO NOTHING para a tabela do modelo
+
+    O alvo explícito faz o banco recusar a inserção se o índice único não
+    existir, em vez de gravar duplicados sem aviso.
+    """
+    dialetos = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
     try:
-        if model == SaleData:
-            objetos = [processar_dados_venda_entrada(d) for d in dados if d is not None]
-        else:
-            objetos = [model(**d) for d in dados]
+        insert = dialetos[engine.dialect.name]
+    except KeyError:
+        raise ValueError(f"Inserção em massa não suportada para o banco {engine.dialect.name}")
+    return insert(model.__table__).on_conflict_do_nothing(index_elements=list(CHAVES_UNICAS[model]))
 
-        for obj in objetos:
-            if isinstance(obj, SaleData) and verificar_existencia_duplicada(session, obj):
-                logger.warning(f"Dado duplicado encontrado: {obj.referencia_documento}, item: {obj.item}, data: {obj.data}")
-                continue
-            session.add(obj)
+def armazenar_dados_no_banco(dados, model):
+    """
+    Grava os registros (dicionários com as colunas do modelo) em lotes de
+    TAMANHO_LOTE, numa única transação. Duplicados são ignorados pelo banco;
+    retorna o número de linhas inseridas.
+    """
+    if model == SaleData:
+        registros = [processar_dados_venda_entrada(d) for d in dados if d is not None]
+        registros = [r for r in registros if r is not None]
+    else:
+        registros = list(dados)
+    if not registros:
+        return 0
 
-        session.commit()
-        logger.info("Dados armazenados no banco de dados com sucesso")
+    inseridos = 0
+    try:
+        if not garantir_indice_unico(model):
+            raise RuntimeError(f"Sem índice único em {model.__tablename__}; registros não armazenados")
+        comando = insert_ignorando_duplicados(model)
+        with engine.begin() as conn:
+            for inicio in range(0, len(registros), TAMANHO_LOTE):
+                resultado = conn.execute(comando, registros[inicio:inicio + TAMANHO_LOTE])
+                inseridos += max(resultado.rowcount, 0)
+        logger.info(f"{inseridos} de {len(registros)} registros armazenados em {model.__tablename__} "
+                    f"({len(registros) - inseridos} duplicados ignorados)")
     except Exception as e:
         logger.error(f"Erro ao armazenar dados no banco de dados: {str(e)}", exc_info=True)
-        session.rollback()
-    finally:
-        session.close()
+    return inseridos
 
 def processar_dados_venda_entrada(dado):
     try:
@@ -374,42 +627,22 @@ def processar_dados_venda_entrada(dado):
             'percentual_desconto': float(dado['% DescontoDataTypeNumber'].replace(',', '.')),
             'motivo_desconto': dado['Motivo Desconto'] if dado['Motivo Desconto'] else None
         }
-        return SaleData(**dado_processado)
+        return dado_processado
     except Exception as e:
         logger.error(f"Erro ao processar dados de entrada: {str(e)}", exc_info=True)
         return None
 
-def verificar_existencia_duplicada(session, dado):
-    existe = session.query(SaleData).filter(
-        and_(
-            SaleData.referencia_documento == dado.referencia_documento,
-            SaleData.item == dado.item,
-            SaleData.data == dado.data
-        )
-    ).first()
-    return existe is not None
-
 def resetar_dados_hora_atual(loja, hora_atual):
     session = SessionLocal()
     try:
-        
-        # Deletar registros de contagem de pessoas da hora atual
-        session.execute(text("""
-            DELETE FROM people_counting_data
-            WHERE loja = :loja AND strftime('%Y-%m-%d %H', start_time) = :hora_atual
-        """), {'loja': loja, 'hora_atual': hora_atual.strftime('%Y-%m-%d %H')})
-
-        # Deletar registros de heatmap da hora atual
-        session.execute(text("""
-            DELETE FROM heatmap_data
-            WHERE loja = :loja AND strftime('%Y-%m-%d %H', start_time) = :hora_atual
-        """), {'loja': loja, 'hora_atual': hora_atual.strftime('%Y-%m-%d %H')})
-
-        # Deletar registros de contagem regional de pessoas da hora atual
-        session.execute(text("""
-            DELETE FROM regional_people_counting_data
-            WHERE loja = :loja AND strftime('%Y-%m-%d %H', start_time) = :hora_atual
-        """), {'loja': loja, 'hora_atual': hora_atual.strftime('%Y-%m-%d %H')})
+        inicio = hora_atual.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        parametros = {'loja': loja, 'inicio': inicio, 'fim': inicio + timedelta(hours=1)}
+        # Deletar registros de contagem de pessoas, heatmap e contagem regional da hora atual
+        for model in (PeopleCountingData, HeatmapData, RegionalPeopleCountingData):
+            session.execute(text(f"""
+                DELETE FROM {model.__tablename__}
+                WHERE loja = :loja AND start_time >= :inicio AND start_time < :fim
+            """), parametros)
 
         session.commit()
         logger.info(f"Dados da hora atual resetados para a loja {loja}.")
@@ -445,47 +678,24 @@ def collect_data(interval_type):
         return
 
     logger.info(f"Iniciando coleta de dados para intervalo: {interval_type}")
-    
+
+    janelas = {}
     for loja in stores.keys():
-        # Obter a data do último update em UTC
-        last_update = get_last_update(loja)
-        if last_update:
-            start_date = last_update
-        else:
-            # Se não houver registro anterior, usar o intervalo calculado
-            start_date = start_date
+        # Obter a data do último update em UTC; sem registro anterior, usar o intervalo calculado
+        janelas[loja] = (get_last_update(loja) or start_date, end_date)
 
         # Resetar dados para o horário atual
         resetar_dados_hora_atual(loja, end_date)
 
-        # Processando dados de vendas
-        logger.info(f"Coletando dados de vendas para {loja} de {start_date} até {end_date}...")
-        total_erros_vendas = 0
-        try:
-            erros = coletar_e_armazenar_dados_vendas(loja, start_date, end_date)
-            total_erros_vendas += erros
-        except Exception as e:
-            logger.error(f"Erro ao coletar e armazenar dados de vendas para {loja}: {str(e)}", exc_info=True)
-            total_erros_vendas += 1
-
-        # Processando dados de contagem de pessoas
-        logger.info(f"Coletando dados de contagem de pessoas para {loja}...")
-        process_data_for_store_parallel(loja, stores[loja], start_date, end_date, "vcalogcsv&report_type=0&linetype=31&statistics_type=3", parse_people_counting_data, PeopleCountingData)
-
-        # Processando dados de heatmap
-        logger.info(f"Coletando dados de heatmap para {loja}...")
-        process_data_for_store_parallel(loja, stores[loja], start_date, end_date, "heatmapcsv&sub_type=0", parse_heatmap_data, HeatmapData)
+    # Vendas de todas as lojas de uma vez
+    logger.info(f"Coletando dados de vendas de {len(janelas)} lojas...")
+    asyncio.run(coletar_dados_vendas_lojas(janelas))
 
-        # Processando dados de contagem regional de pessoas
-        logger.info(f"Coletando dados de contagem regional de pessoas para {loja}...")
-        process_data_for_store_parallel(loja, stores[loja], start_date, end_date, "regionalcountlogcsv&report_type=0&lengthtype=0&length=0&region1=1&region2=1&region3=1&region4=1", parse_regional_people_counting_data, RegionalPeopleCountingData)
-
-        # Atualizar a data do último update para UTC
-        if total_erros_vendas == 0:
-            logger.info(f"Todos os dados de vendas foram atualizados com sucesso para {loja}.")
-        else:
-            logger.info(f"Dados de vendas foram atualizados com {total_erros_vendas} erros para {loja}.")
+    # Contagem de pessoas, heatmap e contagem regional de todas as lojas de uma vez
+    asyncio.run(coletar_dados_camaras(janelas))
 
+    # Atualizar a data do último update para UTC
+    for loja, (_, end_date) in janelas.items():
         set_last_update(loja, end_date)
 
     # Iniciar o outro script a cada coleta de dados
@@ -510,6 +720,9 @@ def schedule_jobs():
 
 # Função principal para executar as tarefas agendadas
 def main(): 
+    # Índices únicos usados pela deduplicação no banco
+    garantir_indices_unicos()
+
     # Coleta inicial ao iniciar o script
     collect_data("hora_cheia")
 
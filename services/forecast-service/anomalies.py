@@ -0,0 +1,45 @@
+"""
+Anomaly scoring against forecast intervals
+
+An observed point is anomalous when it falls outside the model's 95%
+interval at that date. Its score is the deviation from yhat in standard
+errors implied by the interval width, signed (positive = above the
+expected value), so callers can rank anomalies across series of very
+different scale.
+
+Scoring runs once over every point of every series in a request:
+series are concatenated, scored with NumPy, and split back by length.
+"""
+
+from typing import Dict, List
+import numpy as np
+
+from fast_methods import Z_95
+
+
+def score(y: np.ndarray, yhat: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> Dict[str, np.ndarray]:
+    """Signed score and anomaly flag for each point (all arrays the same length)"""
+    se = (upper - lower) / (2 * Z_95)
+    deviation = y - yhat
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(se > 0, deviation / se, np.sign(deviation) * np.inf)
+    return {
+        'score': np.nan_to_num(scores, nan=0.0),
+        'anomaly': (y < lower) | (y > upper)
+    }
+
+
+def score_many(rows: List[Dict[str, np.ndarray]]) -> List[Dict[str, np.ndarray]]:
+    """
+    score() for many series at once
+
+    Each row holds 'y', 'yhat', 'lower' and 'upper' arrays for one series;
+    the result has the same keys as score() per row.
+    """
+    if not rows:
+        return []
+    lengths = [len(row['y']) for row in rows]
+    combined = score(*(np.concatenate([row[name] for row in rows]) for name in ('y', 'yhat', 'lower', 'upper')))
+    splits = np.cumsum(lengths)[:-1]
+    parts = {name: np.split(values, splits) for name, values in combined.items()}
+    return [{name: parts[name][i] for name in parts} for i in range(len(rows))]
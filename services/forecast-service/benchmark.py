@@ -0,0 +1,356 @@
+"""
+Forecast service benchmark and backtest harness
+
+Generates synthetic sustainability series (energy, water, waste,
+emissions; monthly, daily and hourly, of varying length) and drives the
+FastAPI app in-process, through its real request path, lifespan and
+process pool:
+
+1. Latency: one /predict per series and method at a fixed concurrency;
+   reports p50/p95/p99/mean latency and throughput per method.
+2. Backtest: rolling-origin evaluation per method; each series is cut at
+   several origins, forecast `--backtest-horizon` steps ahead and scored
+   against the held-out points (sMAPE and MASE).
+
+Peak RSS of the API process and of every pool worker is sampled
+throughout. Results go to a JSON file (with the git commit) so runs can be
+compared between commits:
+
+    python benchmark.py --concurrency 8 --output bench-$(git rev-parse --short HEAD).json
+
+The result cache is disabled unless --with-cache is given, so every
+request measures a real forecast. Requires httpx (pip install httpx).
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DOMAINS = ('energy', 'water', 'waste', 'emissions')
+METHODS = ('prophet', 'auto', 'seasonal_naive', 'linear_seasonal', 'holt_winters')
+
+# Multiplicative components per domain: level, trend per year, yearly,
+# weekly and hour-of-day amplitude (relative), noise (relative std)
+DOMAIN_PROFILES = {
+    'energy': {'level': 12000.0, 'trend': -0.02, 'yearly': 0.25, 'weekly': 0.10, 'daily': 0.30, 'noise': 0.05},
+    'water': {'level': 800.0, 'trend': 0.01, 'yearly': 0.30, 'weekly': 0.05, 'daily': 0.40, 'noise': 0.08},
+    'waste': {'level': 40.0, 'trend': 0.0, 'yearly': 0.10, 'weekly': 0.30, 'daily': 0.10, 'noise': 0.15},
+    'emissions': {'level': 350.0, 'trend': -0.05, 'yearly': 0.20, 'weekly': 0.08, 'daily': 0.30, 'noise': 0.06},
+}
+
+FREQUENCIES = {
+    # pandas alias, history lengths, periods per year, season length for MASE
+    'monthly': {'freq': 'MS', 'lengths': (18, 24, 36, 60), 'per_year': 12, 'season': 12},
+    'daily': {'freq': 'D', 'lengths': (120, 365, 730), 'per_year': 365.25, 'season': 7},
+    'hourly': {'freq': 'h', 'lengths': (24 * 14, 24 * 60, 24 * 180), 'per_year': 8766, 'season': 24},
+}
+
+
+def synthetic_series(domain: str, frequency: str, length: int, rng: np.random.Generator) -> Dict:
+    """One synthetic series as a columnar `history` payload"""
+    profile = DOMAIN_PROFILES[domain]
+    spec = FREQUENCIES[frequency]
+    start = np.datetime64('2018-01-01') + np.timedelta64(int(rng.integers(0, 365)), 'D')
+    if frequency == 'monthly':
+        start = start.astype('datetime64[M]')
+
+    t = np.arange(length)
+    years = t / spec['per_year']
+    phase = rng.uniform(0, 2 * np.pi)
+    values = (
+        profile['level'] * rng.uniform(0.5, 2.0)
+        * (1 + profile['trend'] * years)
+        * (1 + profile['yearly'] * np.sin(2 * np.pi * years + phase))
+        * (1 + rng.normal(0, profile['noise'], length))
+    )
+    if frequency in ('daily', 'hourly'):
+        day = t // 24 if frequency == 'hourly' else t
+        weekday = (day + int(rng.integers(0, 7))) % 7
+        values *= 1 - profile['weekly'] * (weekday >= 5)  # quieter weekends
+    if frequency == 'hourly':
+        values *= 1 + profile['daily'] * np.sin(2 * np.pi * ((t % 24) - 9) / 24)  # daytime peak
+    values = np.clip(values, 0.0, None)
+
+    return {
+        'domain': domain,
+        'frequency': frequency,
+        'history': {
+            'start': str(start.astype('datetime64[D]')),
+            'freq': spec['freq'],
+            'values': values.round(4).tolist()
+        }
+    }
+
+
+def generate_series(series_per_domain: int, frequencies: List[str], seed: int) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    generated = []
+    for frequency in frequencies:
+        lengths = FREQUENCIES[frequency]['lengths']
+        for domain in DOMAINS:
+            for i in range(series_per_domain):
+                generated.append(synthetic_series(domain, frequency, lengths[i % len(lengths)], rng))
+    return generated
+
+
+def _request_body(item: Dict, values: List[float], method: str, horizon: int, intervals: str) -> Dict:
+    return {
+        'domain': item['domain'],
+        'organizationId': 'benchmark',
+        'history': {**item['history'], 'values': values},
+        'monthsToForecast': horizon,
+        'method': method,
+        'intervals': intervals
+    }
+
+
+class RssSampler:
+    """Tracks peak RSS (VmHWM) of this process and of the pool's workers"""
+
+    def __init__(self):
+        self.peaks_kb: Dict[int, int] = {}
+
+    def sample(self) -> None:
+        for pid in [os.getpid()] + [p.pid for p in multiprocessing.active_children()]:
+            peak = _peak_rss_kb(pid)
+            if peak is not None:
+                self.peaks_kb[pid] = max(self.peaks_kb.get(pid, 0), peak)
+
+    async def run(self, interval: float = 0.5) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+    def report(self) -> Dict:
+        api_kb = self.peaks_kb.get(os.getpid(), 0)
+        workers = {pid: kb for pid, kb in self.peaks_kb.items() if pid != os.getpid()}
+        return {
+            'api_peak_rss_mb': round(api_kb / 1024, 1),
+            'worker_peak_rss_mb': round(max(workers.values(), default=0) / 1024, 1),
+            'workers_sum_peak_rss_mb': round(sum(workers.values()) / 1024, 1),
+            'workers_seen': len(workers)
+        }
+
+
+def _peak_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+    return None
+
+
+def latency_summary(latencies: List[float], errors: int, wall_seconds: float) -> Dict:
+    stats = {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_rps': round(len(latencies) / wall_seconds, 2) if wall_seconds > 0 else None
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        stats.update({
+            'p50_ms': round(p50 * 1000, 2),
+            'p95_ms': round(p95 * 1000, 2),
+            'p99_ms': round(p99 * 1000, 2),
+            'mean_ms': round(float(np.mean(latencies)) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2)
+        })
+    return stats
+
+
+def forecast_errors(actual: np.ndarray, predicted: np.ndarray, train: np.ndarray, season: int) -> Dict[str, float]:
+    """sMAPE (%) and MASE against the in-sample seasonal naive (naive when too short)"""
+    denominator = np.abs(actual) + np.abs(predicted)
+    smape = float(np.mean(np.where(denominator > 0, 2 * np.abs(predicted - actual) / denominator, 0.0)) * 100)
+    m = season if len(train) > season else 1
+    scale = float(np.mean(np.abs(train[m:] - train[:-m]))) if len(train) > m else 0.0
+    mase = float(np.mean(np.abs(predicted - actual)) / scale) if scale > 0 else float('nan')
+    return {'smape': smape, 'mase': mase}
+
+
+async def run_latency(client, generated: List[Dict], method: str, horizon: int, concurrency: int, intervals: str) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(item: Dict) -> None:
+        nonlocal errors
+        async with semaphore:
+            body = _request_body(item, item['history']['values'], method, horizon, intervals)
+            started = time.perf_counter()
+            response = await client.post('/predict', json=body)
+            elapsed = time.perf_counter() - started
+        if response.status_code == 200:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in generated))
+    return latency_summary(latencies, errors, time.perf_counter() - started)
+
+
+async def run_backtest(client, generated: List[Dict], method: str, horizon: int, origins: int, step: int, concurrency: int) -> Dict:
+    """Rolling-origin backtest: cut each series at `origins` points, `step` apart"""
+    semaphore = asyncio.Semaphore(concurrency)
+    scores: List[Dict[str, float]] = []
+    skipped = 0
+
+    async def one(item: Dict, cut: int) -> None:
+        nonlocal skipped
+        values = np.asarray(item['history']['values'])
+        train, actual = values[:cut], values[cut:cut + horizon]
+        body = _request_body(item, train.tolist(), method, horizon, 'none')
+        async with semaphore:
+            response = await client.post('/predict', json=body)
+        if response.status_code != 200:
+            skipped += 1
+            return
+        predicted = np.asarray(response.json()['forecasted'])
+        season = FREQUENCIES[item['frequency']]['season']
+        scores.append(forecast_errors(actual, predicted, train, season))
+
+    jobs = []
+    for item in generated:
+        n = len(item['history']['values'])
+        for k in range(origins):
+            cut = n - horizon - k * step
+            if cut >= 12:
+                jobs.append(one(item, cut))
+    await asyncio.gather(*jobs)
+
+    summary: Dict = {'forecasts': len(scores), 'skipped': skipped}
+    for name in ('smape', 'mase'):
+        finite = [s[name] for s in scores if np.isfinite(s[name])]
+        summary[f'mean_{name}'] = round(float(np.mean(finite)), 4) if finite else None
+        summary[f'median_{name}'] = round(float(np.median(finite)), 4) if finite else None
+    return summary
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    import httpx
+    import main
+
+    generated = generate_series(args.series_per_domain, args.frequencies, args.seed)
+    sampler = RssSampler()
+    results: Dict = {'latency': {}, 'backtest': {}}
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            warm_up_started = time.perf_counter()
+            while main.WARMUP_ENABLED and (await client.get('/ready')).status_code != 200:
+                if main.warm_up_status['error']:
+                    raise RuntimeError(f"Warm-up failed: {main.warm_up_status['error']}")
+                await asyncio.sleep(0.1)
+            results['warm_up_seconds'] = round(time.perf_counter() - warm_up_started, 3)
+
+            sampling = asyncio.create_task(sampler.run())
+            try:
+                for method in args.methods:
+                    print(f"latency: {method}", file=sys.stderr)
+                    results['latency'][method] = await run_latency(
+                        client, generated, method, args.horizon, args.concurrency, args.intervals
+                    )
+                if args.origins > 0:
+                    for method in args.methods:
+                        print(f"backtest: {method}", file=sys.stderr)
+                        results['backtest'][method] = await run_backtest(
+                            client, generated, method, args.backtest_horizon,
+                            args.origins, args.origin_step, args.concurrency
+                        )
+            finally:
+                sampler.sample()
+                sampling.cancel()
+
+    results['memory'] = sampler.report()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', default=','.join(METHODS), help='comma-separated forecast methods')
+    parser.add_argument('--frequencies', default='monthly,daily', help='comma-separated: monthly,daily,hourly')
+    parser.add_argument('--series-per-domain', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight at once')
+    parser.add_argument('--workers', type=int, help='pool workers (FORECAST_WORKERS)')
+    parser.add_argument('--horizon', type=int, default=12, help='periods forecast in the latency runs')
+    parser.add_argument('--intervals', default='sampling', choices=('none', 'analytic', 'sampling'))
+    parser.add_argument('--origins', type=int, default=3, help='backtest origins per series (0 skips backtests)')
+    parser.add_argument('--origin-step', type=int, default=3, help='periods between backtest origins')
+    parser.add_argument('--backtest-horizon', type=int, default=6)
+    parser.add_argument('--with-cache', action='store_true', help='keep the result cache enabled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json')
+    args = parser.parse_args(argv)
+
+    args.methods = [m for m in args.methods.split(',') if m]
+    args.frequencies = [f for f in args.frequencies.split(',') if f]
+    for method in args.methods:
+        if method not in METHODS:
+            parser.error(f"unknown method: {method}")
+    for frequency in args.frequencies:
+        if frequency not in FREQUENCIES:
+            parser.error(f"unknown frequency: {frequency}")
+    return args
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    # Service configuration is read at import time, so set it before importing main
+    if args.workers:
+        os.environ['FORECAST_WORKERS'] = str(args.workers)
+    if not args.with_cache:
+        os.environ['FORECAST_CACHE_TTL'] = '0'
+    os.environ.setdefault('FORECAST_MODEL_DIR', tempfile.mkdtemp(prefix='forecast-bench-models-'))
+    os.environ.setdefault('FORECAST_MAX_QUEUE', str(max(args.concurrency * 2, 16)))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    started = time.time()
+    results = asyncio.run(run(args))
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'duration_seconds': round(time.time() - started, 3),
+        **results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({'latency': report['latency'], 'backtest': report['backtest'], 'memory': report['memory']}, indent=2))
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,204 @@
+"""
+Content-addressed forecast result cache
+
+Forecasts are keyed by a hash of the normalized request (domain, series,
+horizon, model options and the model version), not by who asked for them,
+so identical 4-hourly refreshes are served without refitting. Entries live
+in an in-memory LRU bounded by count and approximate bytes; an optional
+SQLite tier keeps them across restarts.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Disk tier housekeeping runs once every this many writes
+DISK_PRUNE_EVERY = 256
+
+
+def request_fingerprint(request: Dict, model_version: str, exclude: Iterable[str] = ()) -> str:
+    """
+    Stable hash of a forecast request
+
+    Fields in `exclude` (e.g. organizationId, caller keys) do not change the
+    forecast and are left out so equal series share one entry.
+    """
+    normalized = {k: v for k, v in request.items() if k not in set(exclude)}
+    normalized['_model_version'] = model_version
+    payload = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ForecastCache:
+    """
+    Two-tier (memory LRU + optional SQLite) TTL cache of JSON-able dicts
+
+    Used for forecast results and for other per-series state (warm-start
+    parameters); each user gets its own SQLite table.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        max_bytes: int,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+        table: str = 'forecast_cache'
+    ):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+
+        # key -> (expires_at, size_bytes, value)
+        self._memory: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_writes = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created_at)')
+            self._prune_disk()
+            logger.info(f"Forecast disk cache enabled at {path} ({self.table})")
+        except sqlite3.Error as e:
+            logger.error(f"Forecast disk cache disabled, could not open {path}: {str(e)}")
+            self._db = None
+
+    def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return value
+                self._drop(key)
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._hits += 1
+        # Promote to memory with its remaining lifetime preserved
+        self._memory_put(key, value[0], value[1])
+        return value[0]
+
+    def put(self, key: str, value: Dict) -> None:
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_put(key, value, expires_at)
+        self._disk_put(key, value, expires_at)
+
+    def _memory_put(self, key: str, value: Dict, expires_at: float) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._drop(key)
+            self._memory[key] = (expires_at, size, value)
+            self._memory_bytes += size
+            while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+                oldest = next(iter(self._memory))
+                self._drop(oldest)
+                self._evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._memory.pop(key)
+        self._memory_bytes -= size
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[Dict, float]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                f'SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Forecast disk cache read failed: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_put(self, key: str, value: Dict, expires_at: float) -> None:
+        if self._db is None:
+            return
+        try:
+            now = time.time()
+            self._db.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value, default=str), expires_at, now)
+            )
+            self._disk_writes += 1
+            if self._disk_writes % DISK_PRUNE_EVERY == 0:
+                self._prune_disk()
+        except sqlite3.Error as e:
+            logger.warning(f"Forecast disk cache write failed: {str(e)}")
+
+    def _prune_disk(self) -> None:
+        """Keep the disk tier bounded: drop expired rows, then the oldest"""
+        self._db.execute(f'DELETE FROM {self.table} WHERE expires_at < ?', (time.time(),))
+        self._db.execute(
+            f'DELETE FROM {self.table} WHERE key IN ('
+            f' SELECT key FROM {self.table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+            (self.disk_max_entries,)
+        )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._memory),
+                'bytes': self._memory_bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'disk': self._db is not None
+            }
@@ -0,0 +1,505 @@
+"""
+Forecast fitting routines
+
+Everything in this module runs inside the forecast process pool, so it
+only takes and returns plain (picklable) dicts and must not import the
+FastAPI app. Prophet is imported lazily: the API process imports this
+module for its constants and errors but never fits, and workers load
+Prophet (and the compiled Stan model) once, in warm_up_worker().
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+import gc
+import logging
+import os
+import shutil
+import sys
+import time
+
+from fast_methods import build_payload
+import series
+
+if TYPE_CHECKING:
+    from prophet import Prophet
+
+logger = logging.getLogger(__name__)
+
+MIN_HISTORY_POINTS = 12
+HISTORY_TOO_SHORT = "Need at least 12 historical data points for reliable forecasting"
+
+# Bump whenever model configuration changes so cached forecasts are not reused
+MODEL_VERSION = 'prophet-1.1.6/1'
+
+DEFAULT_INTERVAL_SAMPLES = 1000  # Prophet's default posterior draws
+
+# A stored model is only reused for a series within this factor of the
+# scale it was trained on
+MAX_MODEL_SCALE_RATIO = 5.0
+
+# Stan parameters that can seed the next fit of the same series
+WARM_START_PARAMS = ('k', 'm', 'sigma_obs', 'delta', 'beta')
+
+# Set in each worker by warm_up_worker()
+_worker_warm_up: Dict[str, object] = {'seconds': None, 'error': None}
+
+
+class ForecastInputError(ValueError):
+    """Raised when a series cannot be forecast as requested (maps to HTTP 400)"""
+
+
+def fit_and_forecast(
+    request: Dict,
+    init_params: Optional[Dict] = None,
+    lookahead: int = 0,
+    serialize_model: bool = False
+) -> Tuple[Dict, Dict]:
+    """
+    Fit Prophet on a single series and forecast the requested horizon
+
+    `request` is a ForecastRequest dumped to a dict, with its history
+    normalized by series.normalize() under 'history'. `init_params` are
+    fitted parameters from a previous run of the same series, used as the
+    optimizer's starting point. `lookahead` extra periods are predicted
+    beyond the horizon so a later request can be served without refitting.
+    With `serialize_model` the fitted model is returned as JSON for the
+    model registry. `request['regressors']` (optional) lists
+    {'name', 'mode', 'values'} with values for every history point followed
+    by every predicted period (see regressors.align()).
+
+    Returns (ForecastResponse-shaped dict, fit state).
+    """
+    history = request['history']
+    horizon = request['monthsToForecast']
+    intervals = request.get('intervals', 'sampling')
+    samples = request.get('intervalSamples', DEFAULT_INTERVAL_SAMPLES)
+    regressors = request.get('regressors') or []
+
+    # 1. Validate input
+    if series.length(history) < MIN_HISTORY_POINTS:
+        raise ForecastInputError(HISTORY_TOO_SHORT)
+
+    # 2. Transform to Prophet format (requires 'ds' and 'y' columns)
+    timings: Dict[str, float] = {}
+    stage_started = time.perf_counter()
+    df = series.frame(history)
+    for regressor in regressors:
+        df[regressor['name']] = regressor['values'][:len(df)]
+    timings['dataframe'] = time.perf_counter() - stage_started
+
+    freq = history['freq']
+    logger.info(f"Training with {len(df)} data points ({freq}), forecasting {horizon} periods")
+
+    # 3. Initialize Prophet with optimized parameters for sustainability data
+    span = df['ds'].iloc[-1] - df['ds'].iloc[0]
+    model = _build_model(freq, span, regressors)
+
+    # 4. Fit the model to historical data, warm-started when possible
+    fit_started = time.perf_counter()
+    warm_started = False
+    if init_params is not None:
+        try:
+            with pd.option_context('mode.chained_assignment', None):
+                model.fit(df, init=_resize_init(init_params, model, len(df)))
+            warm_started = True
+        except Exception as e:
+            logger.warning(f"Warm start failed, refitting from scratch: {str(e)}")
+            model = _build_model(freq, span, regressors)
+    if not warm_started:
+        with pd.option_context('mode.chained_assignment', None):
+            model.fit(df)
+    fit_seconds = time.perf_counter() - fit_started
+    timings['fit'] = fit_seconds
+
+    # 5. Forecast beyond the history (plus lookahead for warm starts)
+    future_rows = _predict_future(model, horizon + lookahead, intervals, samples, timings, freq, regressors)
+
+    # 6. Build response with forecast and confidence intervals
+    stage_started = time.perf_counter()
+    result = _build_response(
+        future_rows.head(horizon),
+        df['y'],
+        horizon,
+        domain=request['domain'],
+        organization_id=request['organizationId'],
+        intervals=intervals,
+        samples=samples,
+        frequency_info=series.describe(history)
+    )
+    if regressors:
+        result['metadata']['regressors'] = _regressor_coefficients(model)
+    timings['response'] = time.perf_counter() - stage_started
+
+    state = {
+        'params': _extract_params(model),
+        'forecast': {
+            'dates': [ts.isoformat() for ts in future_rows['ds']],
+            'yhat': future_rows['yhat'].tolist(),
+            'lower': future_rows['yhat_lower'].tolist(),
+            'upper': future_rows['yhat_upper'].tolist(),
+            'trend': future_rows['trend'].tolist(),
+            'yearly': future_rows['yearly'].tolist() if 'yearly' in future_rows else None,
+            'interval_mode': 'sampling' if intervals == 'sampling' else 'analytic'
+        },
+        'warm_started': warm_started,
+        'fit_seconds': fit_seconds,
+        'iterations': stan_iterations(model),
+        'timings': timings
+    }
+    if serialize_model:
+        from prophet.serialize import model_to_json
+        state['model_json'] = model_to_json(model)
+
+    return result, state
+
+
+def predict_from_model(
+    model_json: str,
+    horizon: int,
+    domain: str,
+    organization_id: str,
+    intervals: str = 'sampling',
+    samples: int = None
+) -> Dict:
+    """Forecast `horizon` periods from a serialized model without refitting"""
+    from prophet.serialize import model_from_json
+    samples = samples or DEFAULT_INTERVAL_SAMPLES
+    model = model_from_json(model_json)
+    if model.extra_regressors:
+        raise ForecastInputError(
+            "Model was fitted with regressors; forecast through /predict with their future values"
+        )
+    freq = series.detect_frequency(model.history['ds'].to_numpy())
+    future_rows = _predict_future(model, horizon, intervals, samples, freq=freq)
+    return _build_response(
+        future_rows,
+        model.history['y'],
+        horizon,
+        domain=domain,
+        organization_id=organization_id,
+        intervals=intervals,
+        samples=samples,
+        frequency_info={'frequency': freq, 'resampled_from': None}
+    )
+
+
+def _predict_future(
+    model: 'Prophet',
+    periods: int,
+    intervals: str = 'sampling',
+    samples: int = None,
+    timings: Optional[Dict[str, float]] = None,
+    freq: str = 'MS',
+    regressors: Optional[List[Dict]] = None
+) -> pd.DataFrame:
+    """
+    Predict `periods` steps past the end of the model's history
+
+    Prophet's posterior simulation only runs for intervals='sampling';
+    otherwise yhat_lower/yhat_upper come from the analytic approximation
+    (they are still needed for warm-start state even when not returned).
+    Durations of the make_future and predict steps go into `timings`.
+    """
+    stage_started = time.perf_counter()
+    future = model.make_future_dataframe(
+        periods=periods,
+        freq=freq,
+        include_history=False
+    )
+    n_history = len(model.history)
+    for regressor in regressors or []:
+        future[regressor['name']] = regressor['values'][n_history:n_history + periods]
+    made_future = time.perf_counter()
+    forecast = _predict_with_intervals(model, future, intervals, samples)
+    if timings is not None:
+        timings['make_future'] = made_future - stage_started
+        timings['predict'] = time.perf_counter() - made_future
+    return forecast
+
+
+def _predict_with_intervals(model: 'Prophet', frame: pd.DataFrame, intervals: str, samples: Optional[int]) -> pd.DataFrame:
+    model.uncertainty_samples = (samples or DEFAULT_INTERVAL_SAMPLES) if intervals == 'sampling' else 0
+    forecast = model.predict(frame)
+    if intervals != 'sampling':
+        forecast['yhat_lower'], forecast['yhat_upper'] = _analytic_intervals(model, forecast)
+    return forecast
+
+
+def _analytic_intervals(model: 'Prophet', forecast: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form approximation of Prophet's predictive interval
+
+    Combines observation noise (sigma_obs) with the variance of the future
+    trend changes Prophet would simulate: changepoints arrive at rate S per
+    unit of scaled time with Laplace(mean |delta|) slope changes, so the
+    trend deviation h units past the history has variance S * 2b^2 * h^3 / 3.
+    """
+    sigma_obs = float(np.asarray(model.params['sigma_obs']).ravel()[0])
+    deltas = np.asarray(model.params['delta']).ravel()
+    rate = len(model.changepoints_t)
+    laplace_scale = float(np.mean(np.abs(deltas))) + 1e-8
+
+    t = ((forecast['ds'] - model.start) / model.t_scale).to_numpy()
+    ahead = np.clip(t - 1.0, 0.0, None)  # history ends at t = 1
+    trend_variance = rate * 2 * laplace_scale ** 2 * ahead ** 3 / 3
+    multiplier = 1 + forecast['multiplicative_terms'].to_numpy()
+
+    se = model.y_scale * np.sqrt(sigma_obs ** 2 + trend_variance * multiplier ** 2)
+    z = NormalDist().inv_cdf(0.5 + model.interval_width / 2)
+    yhat = forecast['yhat'].to_numpy()
+    return yhat - z * se, yhat + z * se
+
+
+def _build_response(
+    forecasted_values: pd.DataFrame,
+    y: pd.Series,
+    horizon: int,
+    domain: str,
+    organization_id: str,
+    intervals: str = 'sampling',
+    samples: Optional[int] = None,
+    frequency_info: Optional[Dict] = None
+) -> Dict:
+    last = forecasted_values.iloc[-1]
+    return build_payload(
+        'prophet',
+        forecasted_values['yhat'].to_numpy(),
+        forecasted_values['yhat_lower'].to_numpy(),
+        forecasted_values['yhat_upper'].to_numpy(),
+        trend_last=last['trend'],
+        yearly_last=last['yearly'] if 'yearly' in forecasted_values else 0.0,
+        y=y.to_numpy(),
+        horizon=horizon,
+        domain=domain,
+        organization_id=organization_id,
+        interval_mode=intervals,
+        interval_samples=samples if intervals == 'sampling' else None,
+        **(frequency_info or {})
+    )
+
+
+def in_sample_bounds(
+    history: Dict,
+    model_json: Optional[str] = None,
+    intervals: str = 'analytic',
+    samples: Optional[int] = None,
+    serialize_model: bool = False
+) -> Dict:
+    """
+    Prophet's yhat / yhat_lower / yhat_upper at every point of `history`
+
+    Uses the serialized model when given (points after its training data
+    get the widening out-of-sample interval), otherwise fits one on the
+    history itself. A stored model that does not match the series (see
+    _model_mismatch) is refitted. With `serialize_model` a fresh fit is
+    returned as JSON for the registry.
+    """
+    from prophet.serialize import model_from_json, model_to_json
+    df = series.frame(history)
+    freq = history['freq']
+
+    model = None
+    if model_json is not None:
+        model = model_from_json(model_json)
+        mismatch = _model_mismatch(model, history)
+        if mismatch:
+            logger.info(f"Stored model does not match the series ({mismatch}); refitting")
+            model = None
+
+    fit_seconds = None
+    if model is None:
+        if series.length(history) < MIN_HISTORY_POINTS:
+            raise ForecastInputError(HISTORY_TOO_SHORT)
+        model = _build_model(freq, df['ds'].iloc[-1] - df['ds'].iloc[0])
+        fit_started = time.perf_counter()
+        with pd.option_context('mode.chained_assignment', None):
+            model.fit(df)
+        fit_seconds = time.perf_counter() - fit_started
+
+    fitted = _predict_with_intervals(model, df[['ds']], intervals, samples)
+    return {
+        'yhat': fitted['yhat'].to_numpy(),
+        'lower': fitted['yhat_lower'].to_numpy(),
+        'upper': fitted['yhat_upper'].to_numpy(),
+        'refit': fit_seconds is not None,
+        'fit_seconds': fit_seconds,
+        'model_json': model_to_json(model) if serialize_model and fit_seconds is not None else None
+    }
+
+
+def _model_mismatch(model: 'Prophet', history: Dict) -> Optional[str]:
+    """
+    Why a stored model should not score `history` (None if it can)
+
+    It must have no regressors, the same frequency, a training range that
+    contains the series' first date, and a scale within
+    MAX_MODEL_SCALE_RATIO of the series'.
+    """
+    if model.extra_regressors:
+        return "model has regressors"
+    if series.detect_frequency(model.history['ds'].to_numpy()) != history['freq']:
+        return f"model is not {history['freq']}"
+    first = series.dates(history)[0]
+    if not model.start <= first <= model.start + model.t_scale:
+        return f"series starts at {first.date()}, outside the model's training range"
+    values = history['values']
+    scale = np.abs(values).max() if model.scaling == 'absmax' else values.max() - values.min()
+    if model.y_scale > 0 and scale > 0:
+        ratio = max(scale / model.y_scale, model.y_scale / scale)
+    else:
+        ratio = 1.0 if model.y_scale == scale else np.inf
+    if ratio > MAX_MODEL_SCALE_RATIO:
+        return f"series scale {scale:g} vs model scale {model.y_scale:g}"
+    return None
+
+
+def backtest_prophet(request: Dict, holdout: int) -> float:
+    """MAE of Prophet on the last `holdout` points when fitted on the rest"""
+    history = request['history']
+    train = series.head(history, series.length(history) - holdout)
+    result, _ = fit_and_forecast({
+        **request, 'history': train, 'monthsToForecast': holdout, 'intervals': 'none'
+    })
+    actual = history['values'][-holdout:]
+    return float(np.mean(np.abs(np.array(result['forecasted']) - actual)))
+
+
+def _build_model(
+    freq: str = 'MS',
+    span: Optional[pd.Timedelta] = None,
+    regressors: Optional[List[Dict]] = None
+) -> 'Prophet':
+    """
+    Prophet configured for the series frequency
+
+    Monthly and weekly series only get yearly seasonality. Daily and hourly
+    series get weekly (and, hourly, daily) seasonality, plus yearly once
+    they cover two years, Prophet's own threshold. Regressors are added
+    with their requested mode (default: the model's multiplicative mode).
+    """
+    from prophet import Prophet
+    span = span if span is not None else pd.Timedelta(0)
+    coarse = freq in ('MS', 'W-MON')
+    model = Prophet(
+        yearly_seasonality=coarse or span >= pd.Timedelta(days=730),  # Annual patterns (winter/summer)
+        weekly_seasonality=not coarse and span >= pd.Timedelta(days=14),  # Weekday/weekend cycle
+        daily_seasonality=freq == 'h' and span >= pd.Timedelta(days=2),  # Hour-of-day cycle
+        changepoint_prior_scale=0.05,  # Conservative (prevents overfitting)
+        seasonality_prior_scale=10,    # Strong seasonality emphasis
+        interval_width=0.95,           # 95% confidence intervals
+        growth='linear',               # Linear trend (can switch to 'logistic' if needed)
+        seasonality_mode='multiplicative'  # Better for data with seasonal variance
+    )
+    for regressor in regressors or []:
+        try:
+            model.add_regressor(regressor['name'], mode=regressor.get('mode'))
+        except ValueError as e:
+            raise ForecastInputError(f"Invalid regressor {regressor['name']!r}: {str(e)}")
+    return model
+
+
+def _regressor_coefficients(model: 'Prophet') -> List[Dict]:
+    """Fitted effect of each regressor (per unit, in y's units for additive ones)"""
+    from prophet.utilities import regressor_coefficients
+    return [
+        {'name': row.regressor, 'mode': row.regressor_mode, 'coefficient': float(row.coef)}
+        for row in regressor_coefficients(model).itertuples()
+    ]
+
+
+def _extract_params(model: 'Prophet') -> Dict[str, object]:
+    """Fitted point estimates in the shape Stan expects as init values"""
+    params = {}
+    for name in WARM_START_PARAMS:
+        values = np.asarray(model.params[name]).ravel()
+        params[name] = float(values[0]) if name in ('k', 'm', 'sigma_obs') else values.tolist()
+    return params
+
+
+def _resize_init(init_params: Dict, model: 'Prophet', n_points: int) -> Dict:
+    """
+    Adapt stored parameters to this fit
+
+    Short series get fewer changepoints (Prophet caps them at 80% of the
+    history), so `delta` is padded with zeros or truncated to match.
+    """
+    n_changepoints = min(model.n_changepoints, int(np.floor(n_points * model.changepoint_range)) - 1)
+    delta: List[float] = list(init_params['delta'])[:max(n_changepoints, 1)]
+    delta += [0.0] * (max(n_changepoints, 1) - len(delta))
+    return {**init_params, 'delta': np.array(delta), 'beta': np.array(init_params['beta'])}
+
+
+def stan_iterations(model: 'Prophet') -> Optional[int]:
+    """Optimizer iterations of the last fit, read from CmdStan's console log"""
+    try:
+        stdout_file = model.stan_backend.stan_fit.runset.stdout_files[0]
+        with open(stdout_file) as f:
+            lines = f.read().splitlines()
+    except Exception:
+        return None
+    for line in reversed(lines):
+        if line.startswith('Iteration '):
+            try:
+                return int(line.split()[1].rstrip('.'))
+            except (IndexError, ValueError):
+                return None
+    return None
+
+
+def warm_up_worker() -> None:
+    """
+    Pool initializer: import Prophet and run a tiny synthetic fit
+
+    Loads the compiled Stan model and CmdStan's runtime before the first
+    real request reaches this worker. Failures are recorded rather than
+    raised (an initializer error would break the whole pool) and reported
+    through worker_status().
+    """
+    started = time.perf_counter()
+    try:
+        # Three noisy years: converges in ~100 iterations (two-year series can
+        # run L-BFGS to its iteration cap and take seconds)
+        rng = np.random.default_rng(0)
+        t = np.arange(3 * 12)
+        values = 100 + 10 * np.sin(2 * np.pi * t / 12) + rng.normal(0, 2, len(t))
+        fit_and_forecast({
+            'history': series.normalize(values, start='2000-01-01'),
+            'monthsToForecast': 1,
+            'domain': 'warm_up',
+            'organizationId': 'warm_up',
+            'intervals': 'none'
+        })
+        _worker_warm_up['seconds'] = time.perf_counter() - started
+    except Exception as e:
+        logger.error(f"Worker warm-up failed: {str(e)}")
+        _worker_warm_up['error'] = str(e)
+
+
+def clean_up_after_job() -> None:
+    """
+    Pool cleanup hook: delete the files CmdStan wrote for this job's fits
+
+    cmdstanpy keeps every fit's data/init JSON, output CSV and console log
+    in one per-process temp directory that is only removed at exit, so a
+    long-lived worker would fill it up. Also collects the job's pandas
+    garbage before the worker reports its memory.
+    """
+    cmdstanpy = sys.modules.get('cmdstanpy')
+    if cmdstanpy is not None:
+        with os.scandir(cmdstanpy._TMPDIR) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+    gc.collect()
+
+
+def worker_status() -> Dict:
+    """Warm-up outcome of the worker that runs this call"""
+    return {'pid': os.getpid(), **_worker_warm_up}
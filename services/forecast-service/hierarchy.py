@@ -0,0 +1,122 @@
+"""
+Hierarchical forecast reconciliation
+
+A hierarchy (e.g. organization -> site -> metric) is flattened into nodes
+in depth-first order and described by its summing matrix S (nodes x
+leaves): S[i, j] = 1 when leaf j rolls up into node i. Forecasts are
+reconciled so every parent equals the sum of its children:
+
+- bottom_up: only leaves are forecast; every aggregate is S @ leaves
+- mint: every node is forecast, then combined with the MinT/WLS
+  projection S (S' W^-1 S)^-1 S' W^-1, W diagonal with each node's
+  forecast variance (from its interval width) or, without intervals,
+  structural weights (number of leaves under the node)
+
+Both run over all horizon steps at once with NumPy.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from fast_methods import Z_95
+
+RECONCILIATION_METHODS = ('bottom_up', 'mint')
+
+
+class HierarchyError(ValueError):
+    """Raised for malformed trees (duplicate keys, empty tree)"""
+
+
+def flatten(root: Dict) -> Tuple[List[Dict], np.ndarray]:
+    """
+    Depth-first list of nodes and the summing matrix
+
+    `root` is a nested {'key': ..., 'children': [...]} dict; any other
+    fields are kept on the flattened node, which also gets 'index',
+    'parent' (index or None), 'depth' and 'path' (keys from the root).
+    """
+    nodes: List[Dict] = []
+    stack = [(root, None, 0, ())]
+    while stack:
+        node, parent, depth, path = stack.pop()
+        path = path + (node['key'],)
+        children = node.get('children') or []
+        index = len(nodes)
+        nodes.append({
+            **{k: v for k, v in node.items() if k != 'children'},
+            'index': index,
+            'parent': parent,
+            'depth': depth,
+            'path': path,
+            'is_leaf': not children
+        })
+        for child in reversed(children):
+            stack.append((child, index, depth + 1, path))
+
+    keys = [n['key'] for n in nodes]
+    if len(set(keys)) != len(keys):
+        raise HierarchyError("Hierarchy node keys must be unique")
+
+    leaves = [n['index'] for n in nodes if n['is_leaf']]
+    S = np.zeros((len(nodes), len(leaves)))
+    for column, leaf in enumerate(leaves):
+        index: Optional[int] = leaf
+        while index is not None:
+            S[index, column] = 1.0
+            index = nodes[index]['parent']
+    return nodes, S
+
+
+def leaf_indices(nodes: List[Dict]) -> List[int]:
+    return [n['index'] for n in nodes if n['is_leaf']]
+
+
+def bottom_up(S: np.ndarray, leaf_yhat: np.ndarray, leaf_se: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Aggregate leaf forecasts (leaves x horizon) to every node
+
+    Standard errors add in quadrature (leaves treated as independent).
+    """
+    result = {'yhat': S @ leaf_yhat}
+    if leaf_se is not None:
+        result['se'] = np.sqrt(S @ leaf_se ** 2)
+    return result
+
+
+def mint(S: np.ndarray, yhat: np.ndarray, se: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    MinT reconciliation with a diagonal W, vectorized over horizon steps
+
+    `yhat` and `se` are (nodes x horizon) base forecasts and standard
+    errors. Without `se`, W uses structural weights and no reconciled
+    standard errors are returned.
+    """
+    n_nodes, horizon = yhat.shape
+    if se is not None:
+        w = np.maximum(se.T ** 2, 1e-12)  # horizon x nodes
+    else:
+        w = np.broadcast_to(S.sum(axis=1), (horizon, n_nodes))
+
+    # G_h = (S' W_h^-1 S)^-1 S' W_h^-1 for every step h at once
+    St_Winv = S.T[None, :, :] / w[:, None, :]               # h x leaves x nodes
+    G = np.linalg.solve(St_Winv @ S[None, :, :], St_Winv)   # h x leaves x nodes
+    P = S[None, :, :] @ G                                    # h x nodes x nodes
+
+    result = {'yhat': np.einsum('hij,jh->ih', P, yhat)}
+    if se is not None:
+        # Var(P y) = P W P' (diagonal W); keep the diagonal
+        result['se'] = np.sqrt(np.einsum('hij,hj->ih', P ** 2, w))
+    return result
+
+
+def standard_errors(lower: List[float], upper: List[float]) -> Optional[np.ndarray]:
+    """Standard errors implied by 95% bounds, or None when there are none"""
+    if not lower or not upper:
+        return None
+    return (np.asarray(upper, dtype=float) - np.asarray(lower, dtype=float)) / (2 * Z_95)
+
+
+def bounds(yhat: np.ndarray, se: Optional[np.ndarray]) -> Tuple[List[float], List[float]]:
+    if se is None:
+        return [], []
+    return (yhat - Z_95 * se).tolist(), (yhat + Z_95 * se).tolist()
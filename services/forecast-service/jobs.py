@@ -0,0 +1,151 @@
+"""
+Persistent forecast job queue
+
+Long-running forecasts (batches, hierarchies) can be submitted as jobs
+instead of being held open over HTTP. Jobs are stored in SQLite with a
+priority; runners in the API process claim the highest-priority queued job
+(oldest first within a priority), execute it and store the JSON result,
+which clients poll for. Jobs that were running when the process stopped
+are re-queued on startup, and finished jobs are pruned after a TTL.
+"""
+
+from typing import Dict, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Finished-job housekeeping runs once every this many completions
+PRUNE_EVERY = 100
+
+
+class JobQueue:
+    """SQLite-backed priority queue of forecast jobs"""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._completed = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY, kind TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL,'
+            ' request TEXT NOT NULL, result TEXT, error TEXT,'
+            ' created_at REAL NOT NULL, started_at REAL, finished_at REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)')
+
+        with self._lock:
+            recovered = self._db.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+            self._prune()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted forecast jobs")
+        logger.info(f"Forecast job queue at {path}")
+
+    def submit(self, kind: str, request: Dict, priority: int = 0) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO jobs (id, kind, priority, status, request, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, priority, 'queued', json.dumps(request), time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict]:
+        """Mark the next job running and return it (with its request), or None"""
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?"
+                " WHERE id = (SELECT id FROM jobs WHERE status = 'queued'"
+                "             ORDER BY priority DESC, created_at LIMIT 1)"
+                ' RETURNING id, kind, priority, request',
+                (time.time(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'kind': row[1], 'priority': row[2], 'request': json.loads(row[3])}
+
+    def complete(self, job_id: str, result: Dict) -> None:
+        self._finish(job_id, 'succeeded', result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, 'failed', error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id)
+            )
+            self._completed += 1
+            if self._completed % PRUNE_EVERY == 0:
+                self._prune()
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount > 0
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, kind, priority, status, result, error, created_at, started_at, finished_at'
+                ' FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[3] == 'queued':
+                # Jobs that will be claimed before this one
+                position = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+                    ' AND (priority > ? OR (priority = ? AND created_at < ?))',
+                    (row[2], row[2], row[6])
+                ).fetchone()[0]
+        return {
+            'id': row[0],
+            'kind': row[1],
+            'priority': row[2],
+            'status': row[3],
+            'result': json.loads(row[4]) if include_result and row[4] is not None else None,
+            'error': row[5],
+            'created_at': row[6],
+            'started_at': row[7],
+            'finished_at': row[8],
+            'queue_position': position
+        }
+
+    def _prune(self) -> None:
+        """Drop finished jobs past their TTL (caller holds the lock)"""
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        self._db.execute(
+            f'DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?',
+            (*FINISHED_STATUSES, time.time() - self.ttl_seconds)
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows: List = self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
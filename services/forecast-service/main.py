@@ -10,13 +10,38 @@ Port: 8001 (internal only - localhost communication)
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional
-import pandas as pd
-from prophet import Prophet
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Any, List, Dict, Literal, Optional, Tuple
+from contextlib import asynccontextmanager
 from datetime import datetime
+import numpy as np
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import tempfile
+import time
+
+from cache import ForecastCache, request_fingerprint
+from forecasting import (
+    HISTORY_TOO_SHORT, MIN_HISTORY_POINTS, MODEL_VERSION, ForecastInputError,
+    backtest_prophet, clean_up_after_job, fit_and_forecast, in_sample_bounds, predict_from_model,
+    warm_up_worker, worker_status
+)
+from pool import ForecastPool, PoolSaturatedError, available_cpus, process_memory
+from jobs import JobQueue
+from registry import ModelRegistry, model_key
+import anomalies
+import fast_methods
+import hierarchy
+import metrics
+import regressors
+import scenarios
+import series
+import warm_start
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,17 +52,175 @@ logger = logging.getLogger(__name__)
 os.environ['STAN_BACKEND'] = 'CMDSTANPY'
 logger.info("Prophet backend configured: CMDSTANPY")
 
+# Process pool sizing: fits run in FORECAST_WORKERS processes, with up to
+# FORECAST_MAX_QUEUE more jobs waiting before requests get a 429
+FORECAST_WORKERS = int(os.environ.get('FORECAST_WORKERS', str(available_cpus())))
+FORECAST_MAX_QUEUE = int(os.environ.get('FORECAST_MAX_QUEUE', str(FORECAST_WORKERS * 4)))
+RETRY_AFTER_SECONDS = os.environ.get('FORECAST_RETRY_AFTER', '5')
+
+# Workers are replaced once they have run FORECAST_WORKER_MAX_JOBS jobs on
+# average, or as soon as one of them passes FORECAST_WORKER_MAX_RSS_MB of
+# resident memory (0 disables either limit)
+WORKER_MAX_JOBS = int(os.environ.get('FORECAST_WORKER_MAX_JOBS', '500'))
+WORKER_MAX_RSS_BYTES = int(os.environ.get('FORECAST_WORKER_MAX_RSS_MB', '768')) * 1024 * 1024
+
+# Workers import Prophet and run a tiny synthetic fit when they start, and
+# /ready only passes once that has finished. FORECAST_WARMUP=0 skips both
+# (workers then load Prophet on their first request).
+WARMUP_ENABLED = os.environ.get('FORECAST_WARMUP', '1') != '0'
+
+# Batch forecasting limits
+MAX_BATCH_SIZE = int(os.environ.get('FORECAST_MAX_BATCH_SIZE', '500'))
+BATCH_CONCURRENCY = int(os.environ.get('FORECAST_BATCH_CONCURRENCY', str(FORECAST_WORKERS)))
+
+# Result cache: in-memory LRU, plus a SQLite tier when FORECAST_CACHE_PATH is set.
+# FORECAST_CACHE_TTL=0 disables caching.
+CACHE_TTL_SECONDS = float(os.environ.get('FORECAST_CACHE_TTL', str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get('FORECAST_CACHE_MAX_ENTRIES', '5000'))
+CACHE_MAX_BYTES = int(os.environ.get('FORECAST_CACHE_MAX_MB', '64')) * 1024 * 1024
+CACHE_PATH = os.environ.get('FORECAST_CACHE_PATH')
+
+# Warm-start state per (organizationId, domain, metric), persisted to SQLite
+# when FORECAST_STATE_PATH is set. Fits forecast FORECAST_WARM_START_LOOKAHEAD
+# extra periods so later requests can skip refitting.
+STATE_TTL_SECONDS = float(os.environ.get('FORECAST_STATE_TTL', str(90 * 24 * 3600)))
+STATE_MAX_ENTRIES = int(os.environ.get('FORECAST_STATE_MAX_ENTRIES', '20000'))
+STATE_PATH = os.environ.get('FORECAST_STATE_PATH')
+WARM_START_LOOKAHEAD = int(os.environ.get('FORECAST_WARM_START_LOOKAHEAD', '12'))
+
+# Fitted models are serialized under FORECAST_MODEL_DIR for predict-only
+# requests; an empty FORECAST_MODEL_DIR disables the registry.
+MODEL_DIR = os.environ.get('FORECAST_MODEL_DIR', os.path.join(tempfile.gettempdir(), 'blipee-forecast-models'))
+MODEL_MAX = int(os.environ.get('FORECAST_MODEL_MAX', '2000'))
+
+# method="auto" always uses the fast path below FORECAST_AUTO_PROPHET_MIN_POINTS;
+# longer series are backtested against Prophet, and the choice is remembered
+# per series until FORECAST_AUTO_RECHECK_POINTS new points arrive.
+AUTO_PROPHET_MIN_POINTS = int(os.environ.get('FORECAST_AUTO_PROPHET_MIN_POINTS', '24'))
+AUTO_RECHECK_POINTS = int(os.environ.get('FORECAST_AUTO_RECHECK_POINTS', '12'))
+
+# Asynchronous jobs are stored in SQLite at FORECAST_JOB_PATH (an empty value
+# disables the job API) and run FORECAST_JOB_CONCURRENCY at a time, highest
+# priority first. Finished jobs are kept for FORECAST_JOB_TTL seconds.
+JOB_PATH = os.environ.get('FORECAST_JOB_PATH', os.path.join(tempfile.gettempdir(), 'blipee-forecast-jobs.sqlite'))
+JOB_CONCURRENCY = int(os.environ.get('FORECAST_JOB_CONCURRENCY', str(FORECAST_WORKERS)))
+JOB_TTL_SECONDS = float(os.environ.get('FORECAST_JOB_TTL', str(24 * 3600)))
+JOB_POLL_SECONDS = 1.0
+MAX_JOB_WAIT_SECONDS = 60.0
+
+# Regressor series uploaded to /regressors/{id} are kept (parsed) in memory,
+# at most FORECAST_REGRESSOR_MAX of them, for FORECAST_REGRESSOR_TTL seconds
+REGRESSOR_MAX = int(os.environ.get('FORECAST_REGRESSOR_MAX', '2000'))
+REGRESSOR_TTL_SECONDS = float(os.environ.get('FORECAST_REGRESSOR_TTL', str(7 * 24 * 3600)))
+
+# Histories longer than FORECAST_MAX_FIT_POINTS are resampled to the next
+# coarser frequency (hourly -> daily -> weekly -> monthly) until they fit,
+# which keeps fit cost bounded as high-frequency history grows
+MAX_FIT_POINTS = int(os.environ.get('FORECAST_MAX_FIT_POINTS', '5000'))
+
+# Request fields that do not affect the forecast itself
+NON_MODEL_FIELDS = ('organizationId', 'key')
+
+forecast_pool = ForecastPool(
+    max_workers=FORECAST_WORKERS,
+    max_queue=FORECAST_MAX_QUEUE,
+    initializer=warm_up_worker if WARMUP_ENABLED else None,
+    cleanup=clean_up_after_job,
+    max_jobs_per_worker=WORKER_MAX_JOBS,
+    max_rss_bytes=WORKER_MAX_RSS_BYTES
+)
+forecast_cache = ForecastCache(
+    ttl_seconds=CACHE_TTL_SECONDS,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    disk_path=CACHE_PATH
+)
+warm_state = ForecastCache(
+    ttl_seconds=STATE_TTL_SECONDS,
+    max_entries=STATE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    disk_path=STATE_PATH,
+    table='warm_start'
+)
+model_registry: Optional[ModelRegistry] = ModelRegistry(MODEL_DIR, MODEL_MAX) if MODEL_DIR else None
+regressor_store = regressors.RegressorStore(REGRESSOR_MAX, REGRESSOR_TTL_SECONDS)
+# Opened in lifespan: pool workers import this module, and opening the queue
+# there would re-queue the jobs this process is running
+job_queue: Optional[JobQueue] = None
+metrics.register_pool(forecast_pool)
+
+# Futures of forecasts being computed, by result cache key
+in_flight: Dict[str, asyncio.Future] = {}
+
+# Wakes idle job runners on submit; per-job events wake long-polling clients
+job_submitted = asyncio.Event()
+job_finished: Dict[str, asyncio.Event] = {}
+
+# Startup warm-up progress, reported by /ready
+warm_up_status: Dict[str, Any] = {'ready': not WARMUP_ENABLED, 'seconds': None, 'workers': [], 'error': None}
+
+
+async def _warm_up_pool() -> None:
+    """
+    Spawn every worker (each runs warm_up_worker as its initializer) and
+    collect their warm-up results; runs in the background so the server
+    binds its port immediately
+    """
+    started = time.perf_counter()
+    try:
+        workers = await asyncio.gather(*(
+            forecast_pool.submit(worker_status, wait=True) for _ in range(FORECAST_WORKERS)
+        ))
+    except Exception as e:
+        logger.error(f"Forecast pool warm-up failed: {str(e)}")
+        warm_up_status['error'] = str(e)
+        return
+
+    warm_up_status['workers'] = list({w['pid']: w for w in workers}.values())
+    warm_up_status['seconds'] = round(time.perf_counter() - started, 3)
+    errors = [w['error'] for w in warm_up_status['workers'] if w['error']]
+    if errors:
+        logger.error(f"Forecast pool warm-up failed: {errors[0]}")
+        warm_up_status['error'] = errors[0]
+        return
+    warm_up_status['ready'] = True
+    logger.info(f"Forecast pool warmed up in {warm_up_status['seconds']}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    forecast_pool.start()
+    warm_up_task = asyncio.create_task(_warm_up_pool()) if WARMUP_ENABLED else None
+    global job_queue
+    job_queue = JobQueue(JOB_PATH, JOB_TTL_SECONDS) if JOB_PATH else None
+    job_runners = [asyncio.create_task(_job_runner()) for _ in range(JOB_CONCURRENCY)] if job_queue else []
+    yield
+    for task in job_runners:
+        task.cancel()  # Interrupted jobs are re-queued on the next start
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    forecast_pool.shutdown()
+    if job_queue is not None:
+        job_queue.close()
+        job_queue = None
+    forecast_cache.close()
+    warm_state.close()
+    if model_registry is not None:
+        model_registry.close()
+
+
 app = FastAPI(
     title="Blipee Prophet Forecasting Service",
     description="State-of-the-art time series forecasting for sustainability metrics",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS for internal communication with Next.js
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Internal only, safe
-    allow_methods=["POST", "GET"],
+    allow_methods=["POST", "GET", "PUT", "DELETE"],
     allow_headers=["*"],
 )
 
@@ -48,12 +231,77 @@ class HistoricalDataPoint(BaseModel):
     value: float  # Metric value
 
 
+class ColumnarHistory(BaseModel):
+    """
+    Compact history: one values array plus either explicit dates or a
+    regular grid (start + pandas frequency alias)
+    """
+    values: List[float]
+    dates: Optional[List[str]] = None  # ISO dates, same length as values
+    start: Optional[str] = None  # First period of a regular series, e.g. "2022-01-01"
+    freq: Optional[str] = None  # hourly/daily/weekly/monthly (or h/D/W/MS); default monthly for start, detected for dates
+
+    @model_validator(mode='after')
+    def check_dates(self):
+        if (self.dates is None) == (self.start is None):
+            raise ValueError("history needs exactly one of dates or start")
+        if self.dates is not None and len(self.dates) != len(self.values):
+            raise ValueError("history dates and values must have the same length")
+        return self
+
+
+ForecastMethod = Literal['prophet', 'auto', 'seasonal_naive', 'linear_seasonal', 'holt_winters']
+IntervalMode = Literal['none', 'analytic', 'sampling']
+
+
+class RegressorInput(BaseModel):
+    """Exogenous regressor (e.g. degree-days, occupancy) passed to Prophet's add_regressor"""
+    name: str  # Column name in the model, unique per request
+    id: Optional[str] = None  # Series uploaded to PUT /regressors/{id}
+    history: Optional[ColumnarHistory] = None  # Inline values instead of an id
+    mode: Optional[Literal['additive', 'multiplicative']] = None  # Default: the model's (multiplicative)
+    aggregation: Literal['sum', 'mean'] = 'mean'  # How a finer regressor is resampled to the series frequency
+
+    @model_validator(mode='after')
+    def check_source(self):
+        if (self.id is None) == (self.history is None):
+            raise ValueError(f"Regressor {self.name} needs exactly one of id or history")
+        return self
+
+
 class ForecastRequest(BaseModel):
     """Request model for forecast endpoint"""
     domain: str  # "energy", "water", "waste", "emissions"
     organizationId: str
-    historicalData: List[HistoricalDataPoint]
-    monthsToForecast: int
+    historicalData: Optional[List[HistoricalDataPoint]] = None
+    history: Optional[ColumnarHistory] = None  # Compact alternative to historicalData
+    monthsToForecast: int = Field(..., ge=1)  # Periods to forecast, at the forecast frequency (months for monthly data)
+    frequency: Optional[str] = None  # Forecast frequency; finer history is resampled to it (default: the history's own)
+    aggregation: Literal['sum', 'mean'] = 'sum'  # How resampling combines points ("sum" for consumption)
+    method: ForecastMethod = 'prophet'  # "auto" picks a fast method for short/simple series
+    intervals: IntervalMode = 'sampling'  # How confidence bounds are computed ("none" skips them)
+    intervalSamples: int = Field(1000, ge=10, le=10000)  # Posterior draws when intervals="sampling"
+    metric: Optional[str] = None  # Enables warm starts per (organizationId, domain, metric)
+    warmStart: bool = True  # Seed the fit with the series' previous parameters
+    skipRefitWithinInterval: bool = False  # Reuse the previous fit if new points stay inside its interval
+    regressors: List[RegressorInput] = []  # Must cover the history and the forecast periods (Prophet only)
+
+    @model_validator(mode='after')
+    def check_history(self):
+        if (self.historicalData is None) == (self.history is None):
+            raise ValueError("Provide exactly one of historicalData or history")
+        if self.regressors:
+            if self.method in fast_methods.FAST_METHODS:
+                raise ValueError("regressors require method 'prophet' or 'auto'")
+            if len({r.name for r in self.regressors}) != len(self.regressors):
+                raise ValueError("Regressor names must be unique")
+        return self
+
+    @property
+    def history_length(self) -> int:
+        if self.history is not None:
+            return len(self.history.values)
+        return len(self.historicalData)
 
 
 class ForecastResponse(BaseModel):
@@ -64,6 +312,220 @@ class ForecastResponse(BaseModel):
     metadata: Dict
 
 
+class Scenario(BaseModel):
+    """What-if adjustment of the baseline forecast"""
+    name: str
+    multiplier: float = Field(1.0, ge=0)  # Constant scaling, e.g. 0.9 for a 10% reduction
+    growthPerPeriod: float = Field(0.0, gt=-1)  # Compounded per period, e.g. -0.005 for -0.5%/month
+
+
+class ScenarioForecastRequest(ForecastRequest):
+    """Forecast request for several horizons and scenarios from one fit"""
+    monthsToForecast: Optional[int] = None  # Ignored: the longest of `horizons` is forecast
+    horizons: List[int]  # e.g. [3, 6, 12, 24]
+    scenarios: List[Scenario] = []
+
+    @model_validator(mode='after')
+    def check_horizons(self):
+        if not self.horizons or min(self.horizons) < 1:
+            raise ValueError("horizons must be a non-empty list of positive integers")
+        if len({s.name for s in self.scenarios}) != len(self.scenarios):
+            raise ValueError("Scenario names must be unique")
+        self.horizons = sorted(set(self.horizons))
+        return self
+
+
+class HorizonForecast(BaseModel):
+    """Forecast over the first `horizon` periods"""
+    horizon: int
+    forecasted: List[float]
+    confidence: Dict[str, List[float]]
+
+
+class ScenarioForecast(BaseModel):
+    """All horizons of one scenario"""
+    name: str
+    multiplier: float
+    growthPerPeriod: float
+    forecasts: List[HorizonForecast]
+
+
+class ScenarioForecastResponse(BaseModel):
+    """Response model for multi-horizon scenario forecasts"""
+    baseline: List[HorizonForecast]
+    scenarios: List[ScenarioForecast]
+    method: str
+    metadata: Dict  # Of the longest-horizon forecast everything is sliced from
+
+
+class ModelPredictRequest(BaseModel):
+    """Request model for predicting from a registered model"""
+    monthsToForecast: int = Field(..., ge=1)
+    organizationId: Optional[str] = None  # Defaults to the model's organization
+    intervals: IntervalMode = 'sampling'
+    intervalSamples: int = Field(1000, ge=10, le=10000)
+
+
+class BatchForecastItem(ForecastRequest):
+    """Single series in a batch request"""
+    key: Optional[str] = None  # Caller-defined id echoed back in the result
+
+
+class BatchForecastRequest(BaseModel):
+    """Request model for batch forecast endpoint"""
+    series: List[BatchForecastItem]
+
+
+class BatchForecastResult(BaseModel):
+    """Per-series outcome of a batch forecast"""
+    key: str
+    status: str  # "ok" or "error"
+    forecast: Optional[ForecastResponse] = None
+    error: Optional[str] = None
+
+
+class BatchForecastResponse(BaseModel):
+    """Response model for batch forecast endpoint"""
+    results: List[BatchForecastResult]
+    succeeded: int
+    failed: int
+
+
+class AnomalySeries(BaseModel):
+    """Observed series to scan for anomalies"""
+    key: Optional[str] = None  # Caller-defined id echoed back in the result
+    domain: str
+    organizationId: str
+    metric: Optional[str] = None
+    historicalData: Optional[List[HistoricalDataPoint]] = None
+    history: Optional[ColumnarHistory] = None
+    frequency: Optional[str] = None  # Resample finer history to this frequency before scoring
+    aggregation: Literal['sum', 'mean'] = 'sum'
+    modelKey: Optional[str] = None  # Registered model to score against (see model selection on /anomalies)
+    since: Optional[str] = None  # Only report anomalies at or after this date; earlier points still train a fresh fit
+
+    @model_validator(mode='after')
+    def check_history(self):
+        if (self.historicalData is None) == (self.history is None):
+            raise ValueError("Provide exactly one of historicalData or history")
+        return self
+
+
+class AnomalyRequest(BaseModel):
+    """Request model for anomaly scoring endpoint"""
+    series: List[AnomalySeries]
+    intervals: Literal['analytic', 'sampling'] = 'analytic'
+    intervalSamples: int = Field(1000, ge=10, le=10000)
+    reuseModels: bool = True  # Score against the latest registered model of the series (needs metric) instead of refitting
+
+
+class AnomalyPoint(BaseModel):
+    """Observed point outside the model's interval"""
+    date: str
+    value: float
+    expected: float
+    lower: float
+    upper: float
+    score: float  # Deviation from expected in standard errors; positive above, negative below
+
+
+class AnomalySeriesResult(BaseModel):
+    """Per-series outcome of an anomaly scan"""
+    key: str
+    status: str  # "ok" or "error"
+    anomalies: List[AnomalyPoint] = []
+    pointsScored: int = 0
+    modelKey: Optional[str] = None  # Registered model the points were scored against
+    refit: bool = False  # Whether a model was fitted for this call
+    error: Optional[str] = None
+
+
+class AnomalyResponse(BaseModel):
+    """Response model for anomaly scoring endpoint"""
+    results: List[AnomalySeriesResult]
+    anomalies: int
+    succeeded: int
+    failed: int
+
+
+JobKind = Literal['predict', 'batch', 'hierarchy']
+JOB_REQUEST_MODELS = {
+    'predict': ForecastRequest,
+    'batch': BatchForecastRequest,
+}
+
+
+class JobSubmitRequest(BaseModel):
+    """Request model for submitting an asynchronous forecast job"""
+    kind: JobKind  # Which endpoint the request is for: /predict, /predict/batch or /predict/hierarchy
+    request: Dict[str, Any]  # Body that endpoint accepts
+    priority: int = Field(0, ge=-100, le=100)  # Higher runs first (e.g. dashboards 10, bulk refresh -10)
+
+
+class JobStatus(BaseModel):
+    """State of an asynchronous forecast job"""
+    id: str
+    kind: str
+    priority: int
+    status: str  # "queued", "running", "succeeded", "failed" or "cancelled"
+    result: Optional[Dict[str, Any]] = None  # Response of the endpoint, once succeeded
+    error: Optional[str] = None
+    queue_position: Optional[int] = None  # Queued jobs that run before this one
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class HierarchyNode(BaseModel):
+    """Node of a forecast hierarchy, e.g. organization -> site -> metric"""
+    key: str  # Unique within the tree
+    metric: Optional[str] = None  # Warm-start identity; defaults to the node's path
+    historicalData: Optional[List[HistoricalDataPoint]] = None
+    history: Optional[ColumnarHistory] = None  # Required on leaves; optional observed totals (same dates) on parents
+    children: List['HierarchyNode'] = []
+
+    @model_validator(mode='after')
+    def check_history(self):
+        if self.historicalData is not None and self.history is not None:
+            raise ValueError(f"Node {self.key}: provide historicalData or history, not both")
+        if not self.children and self.historicalData is None and self.history is None:
+            raise ValueError(f"Leaf node {self.key} has no history")
+        return self
+
+
+class HierarchicalForecastRequest(BaseModel):
+    """Request model for hierarchical forecast endpoint"""
+    domain: str
+    organizationId: str
+    monthsToForecast: int = Field(..., ge=1)
+    root: HierarchyNode
+    reconciliation: Literal['bottom_up', 'mint'] = 'bottom_up'
+    method: ForecastMethod = 'prophet'
+    intervals: IntervalMode = 'sampling'
+    intervalSamples: int = Field(1000, ge=10, le=10000)
+    warmStart: bool = True
+
+
+JOB_REQUEST_MODELS['hierarchy'] = HierarchicalForecastRequest
+
+
+class HierarchyNodeForecast(BaseModel):
+    """Reconciled forecast of one hierarchy node"""
+    key: str
+    parent: Optional[str] = None
+    depth: int
+    forecasted: List[float]
+    confidence: Dict[str, List[float]]
+    baseForecast: Optional[List[float]] = None  # This node's own (unreconciled) forecast, if it was fitted
+
+
+class HierarchicalForecastResponse(BaseModel):
+    """Response model for hierarchical forecast endpoint"""
+    nodes: List[HierarchyNodeForecast]  # Depth-first, root first
+    reconciliation: str
+    metadata: Dict
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -81,10 +543,40 @@ async def health():
         "status": "healthy",
         "model": "prophet",
         "version": "1.1.6",
-        "backend": "cmdstan"
+        "backend": "cmdstan",
+        "ready": warm_up_status['ready'],
+        "pool": forecast_pool.stats(),
+        "api_memory": process_memory(),
+        "cache": forecast_cache.stats(),
+        "warm_start": warm_state.stats(),
+        "models": model_registry.stats() if model_registry is not None else None,
+        "jobs": job_queue.stats() if job_queue is not None else None,
+        "regressors": regressor_store.stats()
     }
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the pool's workers have loaded Prophet and
+    completed a warm-up fit, 503 before that (or if warm-up failed).
+    /health stays a liveness check.
+    """
+    if not warm_up_status['ready']:
+        raise HTTPException(status_code=503, detail={'ready': False, **_public_warm_up_status()})
+    return {'ready': True, **_public_warm_up_status()}
+
+
+def _public_warm_up_status() -> Dict[str, Any]:
+    return {k: v for k, v in warm_up_status.items() if k != 'ready'}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition: per-domain latency histograms, stage timings and counters"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/predict", response_model=ForecastResponse)
 async def predict(request: ForecastRequest):
     """
@@ -103,79 +595,1058 @@ async def predict(request: ForecastRequest):
     """
     try:
         logger.info(f"Forecast request: {request.domain} for org {request.organizationId}")
-        
-        # 1. Validate input
-        if len(request.historicalData) < 12:
+        response = ForecastResponse(**await _forecast(request))
+        logger.info(f"Forecast generated successfully: {len(response.forecasted)} months")
+        return response
+
+    except PoolSaturatedError as e:
+        logger.warning(f"Forecast rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": RETRY_AFTER_SECONDS})
+    except ForecastInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Forecast error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
+
+
+@app.post("/predict/scenarios", response_model=ScenarioForecastResponse)
+async def predict_scenarios(request: ScenarioForecastRequest):
+    """
+    Forecast several horizons and what-if scenarios from a single fit
+
+    The series is forecast once, for the longest horizon (through the same
+    cache, coalescing and warm starts as /predict, so a plain /predict of
+    that horizon shares the fit). Shorter horizons are its leading periods,
+    and each scenario rescales it by multiplier * (1 + growthPerPeriod)^t.
+    """
+    longest = request.horizons[-1]
+    base_request = ForecastRequest.model_validate({
+        **request.model_dump(exclude={'horizons', 'scenarios'}, exclude_none=True),
+        'monthsToForecast': longest
+    })
+    try:
+        logger.info(f"Scenario forecast request: {request.domain} for org {request.organizationId}, "
+                    f"horizons {request.horizons}, {len(request.scenarios)} scenarios")
+        result = await _forecast(base_request)
+    except PoolSaturatedError as e:
+        logger.warning(f"Forecast rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": RETRY_AFTER_SECONDS})
+    except ForecastInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Forecast error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
+
+    baseline = {
+        'yhat': np.asarray(result['forecasted'], dtype=float),
+        'lower': np.asarray(result['confidence']['lower'], dtype=float),
+        'upper': np.asarray(result['confidence']['upper'], dtype=float)
+    }
+    adjusted = scenarios.apply(baseline, scenarios.factors(
+        [s.multiplier for s in request.scenarios], [s.growthPerPeriod for s in request.scenarios], longest
+    ))
+
+    return ScenarioForecastResponse(
+        baseline=_horizon_forecasts(baseline, request.horizons),
+        scenarios=[
+            ScenarioForecast(
+                name=scenario.name,
+                multiplier=scenario.multiplier,
+                growthPerPeriod=scenario.growthPerPeriod,
+                forecasts=_horizon_forecasts({name: values[i] for name, values in adjusted.items()}, request.horizons)
+            )
+            for i, scenario in enumerate(request.scenarios)
+        ],
+        method=result['method'],
+        metadata=result['metadata']
+    )
+
+
+def _horizon_forecasts(forecast: Dict[str, np.ndarray], horizons: List[int]) -> List[HorizonForecast]:
+    empty = np.empty(0)
+    yhat, lower, upper = (
+        scenarios.slices(forecast.get(name, empty), horizons) for name in ('yhat', 'lower', 'upper')
+    )
+    return [
+        HorizonForecast(horizon=h, forecasted=yhat[i], confidence={'lower': lower[i], 'upper': upper[i]})
+        for i, h in enumerate(horizons)
+    ]
+
+
+@app.post("/predict/batch", response_model=BatchForecastResponse)
+async def predict_batch(request: BatchForecastRequest):
+    """
+    Generate forecasts for many series in one call
+
+    Series are fitted concurrently on the process pool (at most
+    FORECAST_BATCH_CONCURRENCY at a time per batch). Each series succeeds or
+    fails on its own, so one bad series does not fail the whole batch.
+    Results are returned in request order.
+    """
+    _admit_batch(request.series)
+    return await _run_batch(request)
+
+
+async def _run_batch(request: BatchForecastRequest) -> BatchForecastResponse:
+    logger.info(f"Batch forecast request: {len(request.series)} series")
+
+    run_item = _batch_runner(request)
+    results = await asyncio.gather(*(run_item(i, item) for i, item in enumerate(request.series)))
+    succeeded = sum(1 for r in results if r.status == 'ok')
+
+    logger.info(f"Batch forecast finished: {succeeded} ok, {len(results) - succeeded} failed")
+
+    return BatchForecastResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+
+@app.post("/predict/stream")
+async def predict_stream(request: BatchForecastRequest):
+    """
+    Stream batch forecasts as NDJSON, one line per series as it completes
+
+    Lines are BatchForecastResult objects in completion order (use `key` to
+    match them to the request), followed by a final
+    {"done": true, "succeeded": n, "failed": m} line. Clients can persist
+    results while slower fits are still running, and neither side has to
+    hold the whole portfolio in memory. If the client disconnects, the
+    remaining fits are cancelled.
+    """
+    _admit_batch(request.series)
+    logger.info(f"Streaming forecast request: {len(request.series)} series")
+    run_item = _batch_runner(request)
+
+    async def lines():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(request.series)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                succeeded += result.status == 'ok'
+                yield result.model_dump_json() + '\n'
+            failed = len(tasks) - succeeded
+            logger.info(f"Streaming forecast finished: {succeeded} ok, {failed} failed")
+            yield json.dumps({'done': True, 'succeeded': succeeded, 'failed': failed}) + '\n'
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+@app.post("/predict/hierarchy", response_model=HierarchicalForecastResponse)
+async def predict_hierarchy(request: HierarchicalForecastRequest):
+    """
+    Forecast a tree of series with coherent totals
+
+    All leaves must share one date grid. With reconciliation="bottom_up"
+    only leaves are fitted and every parent is the sum of its leaves, so
+    portfolio totals cost no extra fits. With "mint" every node is fitted
+    (parents on their own history, or on the sum of their leaves) and the
+    forecasts are combined with a MinT/WLS projection. Fits run
+    concurrently on the pool; reconciliation is a single NumPy pass.
+    """
+    if forecast_pool.saturated:
+        raise HTTPException(status_code=429, detail="Forecast queue is full", headers={"Retry-After": RETRY_AFTER_SECONDS})
+    return await _run_hierarchy(request)
+
+
+async def _run_hierarchy(request: HierarchicalForecastRequest) -> HierarchicalForecastResponse:
+    try:
+        nodes, S = hierarchy.flatten(_hierarchy_tree(request.root))
+    except hierarchy.HierarchyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(nodes) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Hierarchy too large: {len(nodes)} nodes (max {MAX_BATCH_SIZE})"
+        )
+    logger.info(f"Hierarchical forecast request: {len(nodes)} nodes, {request.reconciliation}")
+
+    leaves = hierarchy.leaf_indices(nodes)
+    fitted = leaves if request.reconciliation == 'bottom_up' else [n['index'] for n in nodes]
+    # Leaves, and parents that are fitted on their own history, must all be
+    # on the same dates, or reconciliation would mix different periods
+    with_history = [i for i in fitted if _has_history(nodes[i]['model'])]
+    try:
+        histories = {i: series.normalize(*_history_columns(nodes[i]['model'])) for i in with_history}
+    except series.SeriesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    reference = histories[leaves[0]]
+    reference_dates = series.dates(reference).asi8
+    for i in with_history:
+        if i != leaves[0] and not np.array_equal(series.dates(histories[i]).asi8, reference_dates):
+            kind = 'Leaf' if i in leaves else 'Node'
             raise HTTPException(
                 status_code=400,
-                detail="Need at least 12 months of historical data for reliable forecasting"
+                detail=f"{kind} {nodes[i]['key']} is not on the same dates as leaf {nodes[leaves[0]]['key']}"
+            )
+
+    leaf_values = np.vstack([histories[i]['values'] for i in leaves])
+    reference_date_keys = series.date_keys(reference)
+
+    def node_request(index: int) -> ForecastRequest:
+        node = nodes[index]
+        model = node['model']
+        fields = {
+            'domain': request.domain,
+            'organizationId': request.organizationId,
+            'monthsToForecast': request.monthsToForecast,
+            'method': request.method,
+            'intervals': request.intervals,
+            'intervalSamples': request.intervalSamples,
+            'warmStart': request.warmStart,
+            'metric': model.metric or '/'.join(node['path'])
+        }
+        if _has_history(model):
+            return ForecastRequest(**fields, history=model.history, historicalData=model.historicalData)
+        # Parent without its own history: fit the sum of its leaves
+        total = S[index] @ leaf_values
+        return ForecastRequest(**fields, history=ColumnarHistory(values=total.tolist(), dates=reference_date_keys))
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_node(index: int) -> Dict[str, Any]:
+        async with semaphore:
+            return await _forecast(node_request(index), wait=True)
+
+    try:
+        results = await asyncio.gather(*(run_node(i) for i in fitted))
+    except ForecastInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Hierarchical forecast error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
+
+    base = dict(zip(fitted, results))
+    yhat = np.vstack([base[i]['forecasted'] for i in fitted])
+    errors = [hierarchy.standard_errors(base[i]['confidence']['lower'], base[i]['confidence']['upper']) for i in fitted]
+    se = np.vstack(errors) if all(e is not None for e in errors) else None
+
+    if request.reconciliation == 'bottom_up':
+        reconciled = hierarchy.bottom_up(S, yhat, se)
+    else:
+        reconciled = hierarchy.mint(S, yhat, se)
+
+    output = []
+    for node in nodes:
+        node_se = reconciled['se'][node['index']] if 'se' in reconciled else None
+        lower, upper = hierarchy.bounds(reconciled['yhat'][node['index']], node_se)
+        output.append(HierarchyNodeForecast(
+            key=node['key'],
+            parent=nodes[node['parent']]['key'] if node['parent'] is not None else None,
+            depth=node['depth'],
+            forecasted=reconciled['yhat'][node['index']].tolist(),
+            confidence={'lower': lower, 'upper': upper},
+            baseForecast=base[node['index']]['forecasted'] if node['index'] in base else None
+        ))
+
+    return HierarchicalForecastResponse(
+        nodes=output,
+        reconciliation=request.reconciliation,
+        metadata={
+            'nodes': len(nodes),
+            'leaves': len(leaves),
+            'fitted_nodes': len(fitted),
+            'cache_hits': sum(1 for r in results if r['metadata'].get('cache_hit')),
+            'forecast_horizon': request.monthsToForecast,
+            'domain': request.domain,
+            'organization_id': request.organizationId,
+            'methods': sorted({r['method'] for r in results}),
+            'generated_at': datetime.utcnow().isoformat()
+        }
+    )
+
+
+@app.post("/anomalies", response_model=AnomalyResponse)
+async def score_anomalies(request: AnomalyRequest):
+    """
+    Flag observed points outside a Prophet model's 95% interval
+
+    Each series is scored against, in order of preference: its `modelKey`;
+    the registered model trained on exactly this history (e.g. by
+    /predict); with `reuseModels` and a `metric`, the latest registered
+    model for its (organizationId, domain, metric), which makes points
+    after its training data out-of-sample; otherwise a model fitted here on
+    the history, which is registered for the next scan. A stored model
+    whose frequency, training range or scale does not match the series is
+    refitted instead. Scoring runs vectorized over all
+    series once their bounds are known.
+    """
+    _admit_batch(request.series)
+    logger.info(f"Anomaly scan request: {len(request.series)} series")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounds(item: AnomalySeries) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[str]]:
+        history = _normalized_history(item)
+        model_json, source_key = await _anomaly_model(item, history, request.reuseModels)
+        async with semaphore:
+            fitted = await forecast_pool.submit(
+                in_sample_bounds, history, model_json, request.intervals, request.intervalSamples,
+                model_registry is not None, wait=True
             )
-        
-        # 2. Transform to Prophet format (requires 'ds' and 'y' columns)
-        df = pd.DataFrame({
-            'ds': pd.to_datetime([d.date for d in request.historicalData]),
-            'y': [d.value for d in request.historicalData]
+        if fitted['refit']:
+            metrics.FITS.labels(metrics.domain_label(item.domain), 'anomaly').inc()
+            source_key = await _register_anomaly_model(item, history, fitted.pop('model_json'))
+        return history, fitted, source_key
+
+    outcomes = await asyncio.gather(*(bounds(item) for item in request.series), return_exceptions=True)
+
+    rows, scored = [], []
+    for item, outcome in zip(request.series, outcomes):
+        if isinstance(outcome, Exception):
+            continue
+        history, fitted, _ = outcome
+        rows.append({'y': history['values'], 'yhat': fitted['yhat'], 'lower': fitted['lower'], 'upper': fitted['upper']})
+    scores = iter(anomalies.score_many(rows))
+
+    results = []
+    for index, (item, outcome) in enumerate(zip(request.series, outcomes)):
+        key = item.key or str(index)
+        if isinstance(outcome, Exception):
+            if not isinstance(outcome, ForecastInputError):
+                logger.error(f"Anomaly scan error for {key}: {str(outcome)}")
+            results.append(AnomalySeriesResult(key=key, status='error', error=str(outcome)))
+            continue
+        history, fitted, source_key = outcome
+        try:
+            points = _anomaly_points(history, fitted, next(scores), item.since)
+        except ValueError as e:
+            results.append(AnomalySeriesResult(key=key, status='error', error=str(e)))
+            continue
+        results.append(AnomalySeriesResult(
+            key=key,
+            status='ok',
+            anomalies=points['anomalies'],
+            pointsScored=points['scored'],
+            modelKey=source_key,
+            refit=fitted['refit']
+        ))
+
+    succeeded = sum(1 for r in results if r.status == 'ok')
+    found = sum(len(r.anomalies) for r in results)
+    logger.info(f"Anomaly scan finished: {found} anomalies in {succeeded} series, {len(results) - succeeded} failed")
+    return AnomalyResponse(results=results, anomalies=found, succeeded=succeeded, failed=len(results) - succeeded)
+
+
+async def _anomaly_model(item: AnomalySeries, history: Dict[str, Any], reuse: bool) -> Tuple[Optional[str], Optional[str]]:
+    """Serialized registered model to score against, and its key (None, None: fit one)"""
+    if model_registry is None:
+        if item.modelKey:
+            raise ForecastInputError("Model registry is disabled")
+        return None, None
+    if item.modelKey:
+        candidates = [item.modelKey]
+    else:
+        candidates = [model_key(item.organizationId, item.domain, item.metric, series.digest(history), MODEL_VERSION)]
+        if reuse and item.metric:
+            # Without a metric, "latest" would be any metric-less series of the domain
+            candidates.append(await asyncio.to_thread(model_registry.latest, item.organizationId, item.domain, item.metric))
+    for key in candidates:
+        if key is None:
+            continue
+        loaded = await asyncio.to_thread(model_registry.load, key)
+        if loaded is not None:
+            return loaded[0], key
+    if item.modelKey:
+        raise ForecastInputError(f"Model {item.modelKey} not found")
+    return None, None
+
+
+async def _register_anomaly_model(item: AnomalySeries, history: Dict[str, Any], model_json: Optional[str]) -> Optional[str]:
+    if model_registry is None or model_json is None:
+        return None
+    data_fingerprint = series.digest(history)
+    key = model_key(item.organizationId, item.domain, item.metric, data_fingerprint, MODEL_VERSION)
+    try:
+        await asyncio.to_thread(model_registry.save, key, model_json, {
+            'organization_id': item.organizationId,
+            'domain': item.domain,
+            'metric': item.metric,
+            'data_fingerprint': data_fingerprint,
+            'data_points': series.length(history)
         })
-        
-        logger.info(f"Training with {len(df)} data points, forecasting {request.monthsToForecast} months")
-        
-        # 3. Initialize Prophet with optimized parameters for sustainability data
-        model = Prophet(
-            yearly_seasonality=True,       # Capture annual patterns (winter/summer)
-            weekly_seasonality=False,      # Not relevant for monthly data
-            daily_seasonality=False,       # Not relevant for monthly data
-            changepoint_prior_scale=0.05,  # Conservative (prevents overfitting)
-            seasonality_prior_scale=10,    # Strong seasonality emphasis
-            interval_width=0.95,           # 95% confidence intervals
-            growth='linear',               # Linear trend (can switch to 'logistic' if needed)
-            seasonality_mode='multiplicative'  # Better for data with seasonal variance
+    except Exception as e:
+        logger.warning(f"Could not register model {key}: {str(e)}")
+        return None
+    return key
+
+
+def _anomaly_points(
+    history: Dict[str, Any],
+    fitted: Dict[str, Any],
+    scored: Dict[str, np.ndarray],
+    since: Optional[str]
+) -> Dict[str, Any]:
+    """Anomalous points (from `since` on) of one series, in date order"""
+    dates = series.dates(history)
+    window = np.ones(len(dates), dtype=bool) if since is None else np.asarray(dates >= np.datetime64(since))
+    keys = series.date_keys(history)
+    return {
+        'scored': int(window.sum()),
+        'anomalies': [
+            AnomalyPoint(
+                date=keys[i],
+                value=float(history['values'][i]),
+                expected=float(fitted['yhat'][i]),
+                lower=float(fitted['lower'][i]),
+                upper=float(fitted['upper'][i]),
+                score=float(scored['score'][i])
+            )
+            for i in np.flatnonzero(scored['anomaly'] & window)
+        ]
+    }
+
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobSubmitRequest):
+    """
+    Queue a forecast to run in the background
+
+    The body is validated up front; the job id is returned immediately.
+    Poll GET /jobs/{id} (optionally long-polling with ?wait=seconds) for
+    the result, which is the response of the corresponding endpoint.
+    Higher-priority jobs are started first, so interactive requests can
+    overtake a queued bulk refresh.
+    """
+    queue = _require_job_queue()
+    try:
+        body = JOB_REQUEST_MODELS[request.kind].model_validate(request.request)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    if request.kind == 'batch':
+        # Queued work waits for the pool, so only the size limits apply
+        _check_batch_size(body.series)
+
+    job_id = await asyncio.to_thread(queue.submit, request.kind, body.model_dump(mode='json'), request.priority)
+    job_submitted.set()
+    logger.info(f"Forecast job {job_id} queued ({request.kind}, priority {request.priority})")
+    return JobStatus(**await asyncio.to_thread(queue.get, job_id))
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, wait: float = 0.0):
+    """
+    Job status, with the result once it has succeeded
+
+    With `wait` (seconds, at most 60) the call long-polls: it returns as
+    soon as the job finishes, or with the current status at the timeout.
+    """
+    queue = _require_job_queue()
+    job = await asyncio.to_thread(queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    wait = min(max(wait, 0.0), MAX_JOB_WAIT_SECONDS)
+    if wait > 0 and job['status'] in ('queued', 'running'):
+        finished = job_finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+        job = await asyncio.to_thread(queue.get, job_id)
+    return JobStatus(**job)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """Cancel a job that has not started yet (409 once it is running or finished)"""
+    queue = _require_job_queue()
+    if not await asyncio.to_thread(queue.cancel, job_id):
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    _notify_job_finished(job_id)
+    return JobStatus(**await asyncio.to_thread(queue.get, job_id))
+
+
+def _require_job_queue() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue is disabled")
+    return job_queue
+
+
+async def _job_runner() -> None:
+    """Claim and run jobs until cancelled, sleeping while the queue is empty"""
+    while True:
+        job_submitted.clear()
+        job = await asyncio.to_thread(job_queue.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(job_submitted.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run_job(job)
+
+
+async def _run_job(job: Dict[str, Any]) -> None:
+    started = time.perf_counter()
+    try:
+        body = JOB_REQUEST_MODELS[job['kind']].model_validate(job['request'])
+        if job['kind'] == 'predict':
+            response = ForecastResponse(**await _forecast(body, wait=True))
+        elif job['kind'] == 'batch':
+            response = await _run_batch(body)
+        else:
+            response = await _run_hierarchy(body)
+        await asyncio.to_thread(job_queue.complete, job['id'], response.model_dump(mode='json'))
+        logger.info(f"Forecast job {job['id']} succeeded in {time.perf_counter() - started:.2f}s")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Forecast job {job['id']} failed: {error}")
+        await asyncio.to_thread(job_queue.fail, job['id'], str(error))
+    _notify_job_finished(job['id'])
+
+
+def _notify_job_finished(job_id: str) -> None:
+    finished = job_finished.pop(job_id, None)
+    if finished is not None:
+        finished.set()
+
+
+def _hierarchy_tree(node: HierarchyNode) -> Dict[str, Any]:
+    return {'key': node.key, 'model': node, 'children': [_hierarchy_tree(c) for c in node.children]}
+
+
+def _check_batch_size(items: List[Any]) -> None:
+    """Reject empty or oversized batches"""
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one series")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(items)} series (max {MAX_BATCH_SIZE})"
         )
-        
-        # 4. Fit the model to historical data
-        with pd.option_context('mode.chained_assignment', None):
-            model.fit(df)
-        
-        # 5. Create future dataframe for forecasting
-        future = model.make_future_dataframe(
-            periods=request.monthsToForecast,
-            freq='MS'  # Month Start frequency
+
+
+def _admit_batch(items: List[Any]) -> None:
+    """Reject empty, oversized, or (when the pool is full) any batch up front"""
+    _check_batch_size(items)
+    if forecast_pool.saturated:
+        raise HTTPException(
+            status_code=429,
+            detail="Forecast queue is full",
+            headers={"Retry-After": RETRY_AFTER_SECONDS}
         )
-        
-        # 6. Generate forecast
-        forecast = model.predict(future)
-        
-        # 7. Extract only future predictions (not historical fit)
-        forecasted_values = forecast.tail(request.monthsToForecast)
-        
-        # 8. Build response with forecast and confidence intervals
-        response = ForecastResponse(
-            forecasted=forecasted_values['yhat'].tolist(),
-            confidence={
-                'lower': forecasted_values['yhat_lower'].tolist(),
-                'upper': forecasted_values['yhat_upper'].tolist()
-            },
-            method='prophet',
-            metadata={
-                'trend': float(forecast['trend'].iloc[-1]),
-                'yearly': float(forecast['yearly'].iloc[-1]) if 'yearly' in forecast else 0.0,
-                'historical_mean': float(df['y'].mean()),
-                'historical_std': float(df['y'].std()),
-                'data_points': len(df),
-                'forecast_horizon': request.monthsToForecast,
-                'domain': request.domain,
-                'organization_id': request.organizationId,
-                'generated_at': datetime.utcnow().isoformat()
-            }
+
+
+def _batch_runner(request: BatchForecastRequest):
+    """
+    Per-item coroutine for a batch: fast-path series are forecast together,
+    vectorized, up front; the rest share a per-batch concurrency limit
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    fast_results = _fast_forecast_many([
+        (i, item) for i, item in enumerate(request.series) if _uses_fast_path(item)
+    ])
+
+    async def run_item(index: int, item: BatchForecastItem) -> BatchForecastResult:
+        key = item.key or str(index)
+        if index in fast_results:
+            outcome = fast_results.pop(index)
+            if isinstance(outcome, ForecastInputError):
+                metrics.FAILURES.labels(metrics.domain_label(item.domain), 'invalid_input').inc()
+                return BatchForecastResult(key=key, status='error', error=str(outcome))
+            if isinstance(outcome, Exception):
+                metrics.FAILURES.labels(metrics.domain_label(item.domain), 'error').inc()
+                return BatchForecastResult(key=key, status='error', error=f"Forecasting failed: {str(outcome)}")
+            return BatchForecastResult(key=key, status='ok', forecast=ForecastResponse(**outcome))
+        async with semaphore:
+            try:
+                # Admitted batches wait for pool slots instead of failing
+                result = await _forecast(item, wait=True)
+                return BatchForecastResult(key=key, status='ok', forecast=ForecastResponse(**result))
+            except ForecastInputError as e:
+                return BatchForecastResult(key=key, status='error', error=str(e))
+            except Exception as e:
+                logger.error(f"Batch forecast error for {key}: {str(e)}")
+                return BatchForecastResult(key=key, status='error', error=f"Forecasting failed: {str(e)}")
+
+    return run_item
+
+
+@app.put("/regressors/{regressor_id}")
+async def put_regressor(regressor_id: str, history: ColumnarHistory):
+    """
+    Store a regressor series (e.g. a site's degree-days) for reuse by id
+
+    Forecast requests then reference it as {"name": ..., "id": regressor_id}
+    instead of sending the values. It should extend past the history far
+    enough to cover the forecast periods. Replaces any series with this id.
+    """
+    try:
+        normalized = series.normalize(history.values, history.dates, history.start, history.freq)
+    except series.SeriesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    info = regressor_store.put(regressor_id, normalized)
+    logger.info(f"Regressor {regressor_id} stored: {info['points']} points ({info['frequency']})")
+    return info
+
+
+@app.get("/regressors/{regressor_id}")
+async def describe_regressor(regressor_id: str):
+    info = regressor_store.describe(regressor_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Regressor {regressor_id} not found")
+    return info
+
+
+@app.delete("/regressors/{regressor_id}")
+async def delete_regressor(regressor_id: str):
+    if not regressor_store.delete(regressor_id):
+        raise HTTPException(status_code=404, detail=f"Regressor {regressor_id} not found")
+    return {"id": regressor_id, "deleted": True}
+
+
+@app.get("/models/{key}")
+async def describe_model(key: str):
+    """Metadata of a registered model"""
+    info = _require_registry().describe(key)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Model {key} not found")
+    return info
+
+
+@app.post("/models/{key}/predict", response_model=ForecastResponse)
+async def predict_from_registered_model(key: str, request: ModelPredictRequest):
+    """
+    Forecast from a registered model without refitting
+
+    `key` is the `metadata.model_key` returned by /predict. Only Prophet's
+    predict step runs, so extending the horizon or re-rendering a forecast
+    costs milliseconds instead of a full fit.
+    """
+    loaded = await asyncio.to_thread(_require_registry().load, key)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail=f"Model {key} not found")
+    model_json, info = loaded
+
+    try:
+        result = await forecast_pool.submit(
+            predict_from_model,
+            model_json,
+            request.monthsToForecast,
+            info['domain'],
+            request.organizationId or info['organization_id'],
+            request.intervals,
+            request.intervalSamples
         )
-        
-        logger.info(f"Forecast generated successfully: {len(response.forecasted)} months")
-        
-        return response
-        
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": RETRY_AFTER_SECONDS})
+    except ForecastInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Forecast error: {str(e)}")
+        logger.error(f"Model predict error for {key}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
 
+    return ForecastResponse(**_with_metadata(result, model_key=key, refit=False))
+
+
+def _require_registry() -> ModelRegistry:
+    if model_registry is None:
+        raise HTTPException(status_code=503, detail="Model registry is disabled")
+    return model_registry
+
+
+async def _forecast(request: ForecastRequest, wait: bool = False) -> Dict[str, Any]:
+    """
+    Forecast one series: fast methods in-process, Prophet on the pool, and
+    identical requests served from the result cache
+
+    Records latency, stage timings and failures in `metrics`. Raises
+    PoolSaturatedError / ForecastInputError for the caller to map.
+    """
+    domain = metrics.domain_label(request.domain)
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    try:
+        result = await _run_forecast(request, wait, timings)
+    except PoolSaturatedError:
+        metrics.FAILURES.labels(domain, 'saturated').inc()
+        raise
+    except ForecastInputError:
+        metrics.FAILURES.labels(domain, 'invalid_input').inc()
+        raise
+    except Exception:
+        metrics.FAILURES.labels(domain, 'error').inc()
+        raise
+    finally:
+        metrics.observe_stages(domain, timings)
+    metrics.REQUEST_SECONDS.labels(domain, metrics.result_path(result)).observe(time.perf_counter() - started)
+    return result
+
+
+async def _run_forecast(request: ForecastRequest, wait: bool, timings: Dict[str, float]) -> Dict[str, Any]:
+    if _uses_fast_path(request):
+        outcome = _fast_forecast_many([(0, request)])[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with metrics.timed(timings, 'prepare'):
+        payload = _payload(request)
+        data_fingerprint = _data_fingerprint(payload)
+        cache_key = _cache_key(payload, data_fingerprint)
+    registry_key = model_key(request.organizationId, request.domain, request.metric, data_fingerprint, MODEL_VERSION)
+
+    with metrics.timed(timings, 'cache_lookup'):
+        cached = forecast_cache.get(cache_key)
+    metrics.CACHE_LOOKUPS.labels(metrics.domain_label(request.domain), 'miss' if cached is None else 'hit').inc()
+    if cached is not None:
+        logger.info(f"Forecast cache hit for {request.domain} / org {request.organizationId}")
+        stored = model_registry is not None and model_registry.describe(registry_key) is not None
+        return _with_metadata(
+            cached,
+            cache_hit=True,
+            organization_id=request.organizationId,
+            model_key=registry_key if stored else None
+        )
+
+    # Identical requests arriving while this one is being computed wait for
+    # its result instead of fitting the same model again
+    leader = in_flight.get(cache_key)
+    if leader is not None:
+        metrics.COALESCED.labels(metrics.domain_label(request.domain)).inc()
+        logger.info(f"Forecast for {request.domain} / org {request.organizationId} coalesced with an in-flight fit")
+        try:
+            result = await asyncio.shield(leader)
+        except asyncio.CancelledError:
+            if not leader.cancelled():
+                raise
+            return await _run_forecast(request, wait, timings)  # The leader was abandoned; compute it here
+        stored = model_registry is not None and model_registry.describe(registry_key) is not None
+        return _with_metadata(
+            result,
+            coalesced=True,
+            organization_id=request.organizationId,
+            model_key=registry_key if stored else None
+        )
+
+    leader = asyncio.get_running_loop().create_future()
+    leader.add_done_callback(lambda f: f.cancelled() or f.exception())  # Failures surface through the waiters
+    in_flight[cache_key] = leader
+    try:
+        result = await _compute_forecast(request, payload, cache_key, data_fingerprint, registry_key, wait, timings)
+    except asyncio.CancelledError:
+        leader.cancel()
+        raise
+    except Exception as e:
+        leader.set_exception(e)
+        raise
+    else:
+        leader.set_result(result)
+    finally:
+        del in_flight[cache_key]
+    return result
+
+
+async def _compute_forecast(
+    request: ForecastRequest,
+    payload: Dict[str, Any],
+    cache_key: str,
+    data_fingerprint: str,
+    registry_key: str,
+    wait: bool,
+    timings: Dict[str, float]
+) -> Dict[str, Any]:
+    """Produce (and cache) a forecast that missed the result cache"""
+    auto_selection = None
+    if request.method == 'auto' and not request.regressors:
+        with metrics.timed(timings, 'auto_select'):
+            selected, auto_selection = await _select_auto_method(payload, wait)
+        if selected != 'prophet':
+            history = payload['history']
+            output = fast_methods.forecast_many(
+                selected, history['values'][None, :], request.monthsToForecast, series.season_length(history)
+            )
+            result = fast_methods.row_payload(
+                selected, output, 0, history['values'], request.monthsToForecast,
+                request.domain, request.organizationId, request.intervals, **series.describe(history)
+            )
+            result = _with_metadata(result, auto=auto_selection)
+            forecast_cache.put(cache_key, result)
+            return _with_metadata(result, cache_hit=False, model_key=None)
+
+    state_key = warm_start.state_key(payload) if request.warmStart else None
+    previous = warm_state.get(state_key) if state_key else None
+
+    # A stored forecast does not know about changed regressor values
+    if previous is not None and request.skipRefitWithinInterval and not payload['regressors']:
+        result = warm_start.try_skip_refit(payload, previous)
+        if result is not None:
+            logger.info(f"Refit skipped for {state_key}: new data within previous interval")
+            metrics.FITS.labels(metrics.domain_label(request.domain), 'skipped_refit').inc()
+            forecast_cache.put(cache_key, result)
+            return _with_metadata(result, cache_hit=False, model_key=None)
+
+    init_params = previous['params'] if previous is not None else None
+    lookahead = WARM_START_LOOKAHEAD if state_key and not payload['regressors'] else 0
+    result, fit_state = await forecast_pool.submit(
+        fit_and_forecast, payload, init_params, lookahead, model_registry is not None,
+        wait=wait, timings=timings
+    )
+    metrics.observe_fit(request.domain, fit_state)
+
+    stored_key = None
+    if model_registry is not None:
+        try:
+            with metrics.timed(timings, 'registry_save'):
+                await asyncio.to_thread(model_registry.save, registry_key, fit_state.pop('model_json'), {
+                    'organization_id': request.organizationId,
+                    'domain': request.domain,
+                    'metric': request.metric,
+                    'data_fingerprint': data_fingerprint,
+                    'data_points': series.length(payload['history'])
+                })
+            stored_key = registry_key
+        except Exception as e:
+            logger.warning(f"Could not register model {registry_key}: {str(e)}")
+
+    if state_key:
+        result = _with_metadata(result, warm_start=warm_start.fit_metadata(fit_state, previous))
+        warm_state.put(state_key, warm_start.build_state(payload, fit_state, previous))
+    if auto_selection is not None:
+        result = _with_metadata(result, auto=auto_selection)
+
+    forecast_cache.put(cache_key, result)
+    return _with_metadata(result, cache_hit=False, model_key=stored_key)
+
+
+def _payload(request: ForecastRequest) -> Dict[str, Any]:
+    """
+    Request as a plain dict for the forecasting code, with either history
+    format normalized into NumPy arrays under 'history'
+    """
+    payload = request.model_dump(exclude={'historicalData', 'history', 'regressors'})
+    payload['history'] = _normalized_history(request)
+    payload['regressors'] = _aligned_regressors(request, payload['history'])
+    return payload
+
+
+def _aligned_regressors(request: ForecastRequest, history: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Regressors resolved (inline or from the store) and aligned to the
+    history plus the forecast periods, as fit_and_forecast() expects them
+    """
+    aligned = []
+    for regressor in request.regressors:
+        try:
+            if regressor.id is not None:
+                stored = regressor_store.get(regressor.id)
+                if stored is None:
+                    raise ForecastInputError(f"Regressor {regressor.id} not found (upload it to /regressors/{regressor.id})")
+                source, digest = stored
+            else:
+                source = series.normalize(*_history_columns(regressor))
+                digest = series.digest(source)
+            values = regressors.align(regressor.name, source, history, request.monthsToForecast, regressor.aggregation)
+        except (regressors.RegressorError, series.SeriesError) as e:
+            raise ForecastInputError(str(e))
+        aligned.append({'name': regressor.name, 'mode': regressor.mode, 'values': values, 'digest': digest})
+    return aligned
+
+
+def _normalized_history(request: Any) -> Dict[str, Any]:
+    """
+    series.normalize()d history of a request carrying history or
+    historicalData plus frequency/aggregation, resampled and bounded
+    """
+    try:
+        history = series.normalize(*_history_columns(request))
+        if request.frequency:
+            history = series.resample(history, series.canonical_frequency(request.frequency), request.aggregation)
+        return series.bound_length(history, MAX_FIT_POINTS, request.aggregation)
+    except series.SeriesError as e:
+        raise ForecastInputError(str(e))
+
+
+def _has_history(request: Any) -> bool:
+    return request.history is not None or request.historicalData is not None
+
+
+def _history_columns(request: Any) -> Tuple:
+    """series.normalize() arguments for a model carrying history or historicalData"""
+    if request.history is not None:
+        h = request.history
+        return h.values, h.dates, h.start, h.freq
+    return [d.value for d in request.historicalData], [d.date for d in request.historicalData]
+
+
+def _data_fingerprint(payload: Dict[str, Any]) -> str:
+    """Digest of the data a model is trained on: the history plus any regressors"""
+    data_fingerprint = series.digest(payload['history'])
+    if not payload.get('regressors'):
+        return data_fingerprint
+    identity = '|'.join([data_fingerprint] + [f"{r['name']}:{r['mode']}:{r['digest']}" for r in payload['regressors']])
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+def _cache_key(payload: Dict[str, Any], data_fingerprint: Optional[str] = None) -> str:
+    """Result cache key; the history (and regressors) enter as a digest, whichever format they came in"""
+    data_fingerprint = data_fingerprint or _data_fingerprint(payload)
+    return request_fingerprint(
+        {**payload, 'history': data_fingerprint, 'regressors': None}, MODEL_VERSION, exclude=NON_MODEL_FIELDS
+    )
+
+
+def _uses_fast_path(request: ForecastRequest) -> bool:
+    """Series answered by the NumPy forecasters without touching the pool"""
+    if request.method in fast_methods.FAST_METHODS:
+        return True
+    return request.method == 'auto' and request.history_length < AUTO_PROPHET_MIN_POINTS and not request.regressors
+
+
+def _fast_forecast_many(items: List[Tuple[int, ForecastRequest]]) -> Dict[int, Any]:
+    """
+    Forecast fast-path series, vectorized across series of equal shape
+
+    Returns {index: result dict or exception}: ForecastInputError for bad
+    input, or whatever a group's forecast raised, so one series cannot fail
+    the others outside its group. Cached series are
+    served from the cache; the rest are grouped by (method, length, horizon,
+    season length) and each group is forecast with one NumPy call. For method="auto" the
+    best fast method per series is chosen by a vectorized holdout backtest.
+    """
+    outcomes: Dict[int, Any] = {}
+    groups: Dict[Tuple[str, int, int, int], List[Tuple[int, ForecastRequest, str, Dict]]] = {}
+
+    for index, request in items:
+        try:
+            payload = _payload(request)
+        except ForecastInputError as e:
+            outcomes[index] = e
+            continue
+        cache_key = _cache_key(payload)
+        cached = forecast_cache.get(cache_key)
+        metrics.CACHE_LOOKUPS.labels(metrics.domain_label(request.domain), 'miss' if cached is None else 'hit').inc()
+        if cached is not None:
+            outcomes[index] = _with_metadata(
+                cached, cache_hit=True, organization_id=request.organizationId, model_key=None
+            )
+            continue
+        history = payload['history']
+        if series.length(history) < MIN_HISTORY_POINTS:
+            outcomes[index] = ForecastInputError(HISTORY_TOO_SHORT)
+            continue
+        group_key = (request.method, series.length(history), request.monthsToForecast, series.season_length(history))
+        groups.setdefault(group_key, []).append((index, request, cache_key, history))
+
+    for (method, n_points, horizon, season), members in groups.items():
+        group_started = time.perf_counter()
+        Y = np.vstack([history['values'] for _, _, _, history in members])
+        selected: List[Optional[str]] = [method] * len(members)
+        auto_metadata: List[Optional[Dict]] = [None] * len(members)
+
+        if method == 'auto':
+            holdout = fast_methods.backtest_holdout(n_points, horizon, season)
+            try:
+                scores = fast_methods.backtest_many(Y, holdout, season_length=season)
+            except Exception as e:
+                logger.error(f"Fast-method backtest failed for {len(members)} series: {str(e)}")
+                for index, _, _, _ in members:
+                    outcomes[index] = e
+                continue
+            selected, _ = fast_methods.select_best(scores)
+            for row in range(len(members)):
+                # Too short to backtest: seasonal naive needs the fewest points
+                selected[row] = selected[row] or 'seasonal_naive'
+                auto_metadata[row] = {
+                    'selected': selected[row],
+                    'reason': 'short_series',
+                    'holdout': holdout,
+                    'backtest_mae': _finite_scores(scores, row)
+                }
+
+        for chosen in set(selected):
+            rows = [row for row, name in enumerate(selected) if name == chosen]
+            if n_points < fast_methods.min_points(chosen, season):
+                for row in rows:
+                    outcomes[members[row][0]] = ForecastInputError(
+                        f"{chosen} needs at least {fast_methods.min_points(chosen, season)} data points"
+                    )
+                continue
+            try:
+                output = fast_methods.forecast_many(chosen, Y[rows], horizon, season)
+            except Exception as e:
+                logger.error(f"{chosen} forecast failed for {len(rows)} series: {str(e)}")
+                for row in rows:
+                    outcomes[members[row][0]] = e
+                continue
+            for position, row in enumerate(rows):
+                index, request, cache_key, history = members[row]
+                try:
+                    result = fast_methods.row_payload(
+                        chosen, output, position, history['values'], horizon,
+                        request.domain, request.organizationId, request.intervals, **series.describe(history)
+                    )
+                except Exception as e:
+                    logger.error(f"{chosen} forecast failed for series {index}: {str(e)}")
+                    outcomes[index] = e
+                    continue
+                if auto_metadata[row] is not None:
+                    result = _with_metadata(result, auto=auto_metadata[row])
+                forecast_cache.put(cache_key, result)
+                outcomes[index] = _with_metadata(result, cache_hit=False, model_key=None)
+
+        per_series = (time.perf_counter() - group_started) / len(members)
+        for _, request, _, _ in members:
+            metrics.STAGE_SECONDS.labels(metrics.domain_label(request.domain), 'fast_forecast').observe(per_series)
+
+    return outcomes
+
+
+async def _select_auto_method(payload: Dict[str, Any], wait: bool) -> Tuple[str, Dict[str, Any]]:
+    """
+    Choose between Prophet and the best fast method for a long series
+
+    Fast methods are backtested in-process; Prophet gets one extra fit on
+    the truncated history. The decision is remembered per series (when a
+    metric is given) until enough new points arrive to re-check.
+    """
+    values = payload['history']['values']
+    n_points = len(values)
+    season = series.season_length(payload['history'])
+    holdout = fast_methods.backtest_holdout(n_points, payload['monthsToForecast'], season)
+    scores = fast_methods.backtest_many(values[None, :], holdout, season_length=season)
+    best, best_error = fast_methods.select_best(scores)
+    selection = {'holdout': holdout, 'backtest_mae': _finite_scores(scores, 0)}
+
+    series_key = warm_start.state_key(payload)
+    memo_key = f"{series_key}|auto" if series_key else None
+    memo = warm_state.get(memo_key) if memo_key else None
+    if memo is not None and 0 <= n_points - memo['data_points'] < AUTO_RECHECK_POINTS:
+        return memo['selected'], {**selection, 'selected': memo['selected'], 'reason': 'remembered'}
+
+    prophet_error = await forecast_pool.submit(backtest_prophet, payload, holdout, wait=wait)
+    metrics.FITS.labels(metrics.domain_label(payload['domain']), 'backtest').inc()
+    selection['backtest_mae']['prophet'] = prophet_error
+
+    if best[0] is not None and best_error[0] <= prophet_error:
+        selected, reason = best[0], 'backtest'
+    else:
+        selected, reason = 'prophet', 'backtest'
+
+    if memo_key:
+        warm_state.put(memo_key, {'selected': selected, 'data_points': n_points})
+    return selected, {**selection, 'selected': selected, 'reason': reason}
+
+
+def _finite_scores(scores: Dict[str, np.ndarray], row: int) -> Dict[str, float]:
+    return {method: float(errors[row]) for method, errors in scores.items() if np.isfinite(errors[row])}
+
+
+def _with_metadata(result: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    """Copy of a result with extra metadata (cached results are shared, never mutated)"""
+    return {**result, 'metadata': {**result['metadata'], **extra}}
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,136 @@
+"""
+Prometheus metrics for the forecast service
+
+Latency is broken down per stage so slow forecasts can be attributed:
+
+- prepare: history normalization and cache key (API process)
+- cache_lookup: result cache get
+- queue_wait: waiting for a pool slot and a free worker
+- dataframe / fit / make_future / predict / response: inside the worker
+- registry_save: writing the fitted model to the registry
+- fast_forecast: NumPy fast-path methods (amortized per series in batches)
+
+Everything is labelled by domain (unknown domains are folded into "other"
+to keep label cardinality bounded) and exported on GET /metrics.
+"""
+
+from contextlib import contextmanager
+from typing import Dict
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from pool import process_memory
+
+KNOWN_DOMAINS = ('energy', 'water', 'waste', 'emissions')
+
+# Seconds; spans sub-millisecond cache hits up to multi-second Stan fits
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ITERATION_BUCKETS = (10, 25, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+REQUEST_SECONDS = Histogram(
+    'forecast_request_duration_seconds',
+    'End-to-end latency of one series forecast',
+    ['domain', 'path'],  # path: cache, coalesced, fast, skipped_refit, fit
+    buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'forecast_stage_duration_seconds',
+    'Time spent in each forecast stage',
+    ['domain', 'stage'],
+    buckets=LATENCY_BUCKETS
+)
+STAN_ITERATIONS = Histogram(
+    'forecast_stan_iterations',
+    'CmdStan optimizer iterations per Prophet fit',
+    ['domain'],
+    buckets=ITERATION_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    'forecast_cache_lookups_total',
+    'Result cache lookups',
+    ['domain', 'result']  # result: hit, miss
+)
+FITS = Counter(
+    'forecast_fits_total',
+    'Prophet fits, and refits avoided',
+    ['domain', 'mode']  # mode: cold, warm, skipped_refit, backtest, anomaly
+)
+COALESCED = Counter(
+    'forecast_coalesced_requests_total',
+    'Requests that waited on an identical in-flight forecast instead of fitting',
+    ['domain']
+)
+FAILURES = Counter(
+    'forecast_failures_total',
+    'Forecasts that did not produce a result',
+    ['domain', 'reason']  # reason: invalid_input, saturated, error
+)
+
+
+def domain_label(domain: str) -> str:
+    return domain if domain in KNOWN_DOMAINS else 'other'
+
+
+def observe_stages(domain: str, timings: Dict[str, float]) -> None:
+    label = domain_label(domain)
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(label, stage).observe(seconds)
+
+
+def observe_fit(domain: str, fit_state: Dict) -> None:
+    """Record a worker's fit: stage timings, mode and Stan iterations"""
+    label = domain_label(domain)
+    observe_stages(domain, fit_state.get('timings', {}))
+    FITS.labels(label, 'warm' if fit_state['warm_started'] else 'cold').inc()
+    if fit_state.get('iterations') is not None:
+        STAN_ITERATIONS.labels(label).observe(fit_state['iterations'])
+
+
+def result_path(result: Dict) -> str:
+    """How a forecast was produced, from its response metadata"""
+    metadata = result['metadata']
+    if metadata.get('cache_hit'):
+        return 'cache'
+    if metadata.get('coalesced'):
+        return 'coalesced'
+    if (metadata.get('warm_start') or {}).get('mode') == 'skipped_refit':
+        return 'skipped_refit'
+    if result['method'] != 'prophet':
+        return 'fast'
+    return 'fit'
+
+
+def register_pool(pool) -> None:
+    """Export live pool occupancy as gauges"""
+    Gauge('forecast_pool_in_flight', 'Jobs running or queued on the pool').set_function(
+        lambda: pool.stats()['in_flight']
+    )
+    Gauge('forecast_pool_queued', 'Jobs waiting for a worker').set_function(
+        lambda: pool.stats()['queued']
+    )
+    Gauge('forecast_pool_rejected', 'Jobs rejected because the pool was full').set_function(
+        lambda: pool.stats()['rejected']
+    )
+    recycles = Gauge('forecast_pool_recycles', 'Times the workers were replaced', ['reason'])  # jobs, rss, broken
+    for reason in pool.stats()['recycles']:
+        recycles.labels(reason).set_function(lambda reason=reason: pool.stats()['recycles'][reason])
+    Gauge('forecast_worker_peak_rss_bytes', 'High-water resident memory of any worker since start').set_function(
+        lambda: pool.stats()['memory']['peak_rss_bytes']
+    )
+    Gauge('forecast_worker_rss_bytes', 'Largest resident memory among recently reporting workers').set_function(
+        lambda: max((w['rss'] for w in pool.stats()['memory']['workers']), default=0)
+    )
+    Gauge('forecast_api_peak_rss_bytes', 'High-water resident memory of the API process').set_function(
+        lambda: process_memory()['peak_rss']
+    )
+
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    """Add the duration of the with-block to timings[stage]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
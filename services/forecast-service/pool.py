@@ -0,0 +1,210 @@
+"""
+Process pool for CPU-bound forecast work
+
+Prophet fits block for hundreds of milliseconds to seconds, so they run in
+a separate process pool instead of on the uvicorn event loop. The pool has
+a bounded number of in-flight jobs; once it is full, new requests are
+rejected (HTTP 429) rather than queued without limit.
+
+Workers report their memory after every job. The pool is recycled (new
+workers take new jobs while the old ones finish theirs and exit) once its
+workers have run max_jobs_per_worker jobs on average, or as soon as one
+worker's RSS passes max_rss_bytes, so leaks in Prophet/CmdStan/pandas
+cannot grow the container until it is OOM-killed. (ProcessPoolExecutor's
+own max_tasks_per_child can deadlock under concurrent submits on Python
+3.11, hence whole-pool generations.)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import multiprocessing
+import logging
+import os
+import resource
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container/affinity limits)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def process_memory() -> Dict[str, int]:
+    """Current and peak resident set size of this process, in bytes"""
+    memory = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    name, value = line.split()[:2]
+                    memory['rss' if name == 'VmRSS:' else 'peak_rss'] = int(value) * 1024
+    except OSError:
+        pass
+    if 'peak_rss' not in memory:
+        memory['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    memory.setdefault('rss', memory['peak_rss'])
+    return memory
+
+
+def _run_job(fn: Callable, cleanup: Optional[Callable], *args: Any) -> Tuple[float, Any, Dict]:
+    """
+    Worker-side wrapper: when the job actually started, its result, and the
+    worker's memory afterwards (once `cleanup` has run)
+    """
+    started = time.time()
+    try:
+        result = fn(*args)
+    finally:
+        if cleanup is not None:
+            cleanup()
+    return started, result, {'pid': os.getpid(), **process_memory()}
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the pool already has the maximum number of jobs in flight"""
+
+
+class ForecastPool:
+    """Bounded async front-end to a ProcessPoolExecutor"""
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue: int,
+        initializer: Optional[Callable] = None,
+        cleanup: Optional[Callable] = None,
+        max_jobs_per_worker: int = 0,
+        max_rss_bytes: int = 0
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.initializer = initializer  # Runs once in every worker, including replacements
+        self.cleanup = cleanup  # Runs in the worker after every job, even a failed one
+        self.max_jobs_per_worker = max_jobs_per_worker  # 0: never recycle on job count
+        self.max_rss_bytes = max_rss_bytes  # 0: never recycle on memory
+        self.capacity = max_workers + max_queue
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._generation_jobs = 0
+        self._recycles: Dict[str, int] = {'jobs': 0, 'rss': 0, 'broken': 0}
+        self._workers: 'OrderedDict[int, Dict]' = OrderedDict()  # Last report per worker pid
+        self._peak_rss = 0
+
+    def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.capacity)
+        self._executor = self._new_executor()
+        logger.info(f"Forecast pool started: {self.max_workers} workers, queue depth {self.max_queue}")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        self._generation_jobs = 0
+        # 'spawn' keeps workers free of the parent's event loop and threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=self.initializer
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def saturated(self) -> bool:
+        return self._slots is not None and self._slots.locked()
+
+    async def submit(
+        self,
+        fn: Callable,
+        *args: Any,
+        wait: bool = False,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Any:
+        """
+        Run fn(*args) in a worker process
+
+        With wait=False the call fails fast with PoolSaturatedError when the
+        pool is full; with wait=True it waits for a free slot (used by batch
+        endpoints, which have already been admitted). If `timings` is given,
+        the time spent waiting for a slot and a free worker is stored in
+        timings['queue_wait'].
+        """
+        if self._executor is None or self._slots is None:
+            raise RuntimeError("Forecast pool is not running")
+        if not wait and self.saturated:
+            self._rejected += 1
+            raise PoolSaturatedError(f"Forecast queue is full ({self.capacity} jobs in flight)")
+
+        submitted = time.time()
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                executor = self._executor
+                try:
+                    started, result, memory = await loop.run_in_executor(executor, _run_job, fn, self.cleanup, *args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM-killed); replace the pool so
+                    # later requests are not poisoned by it
+                    if self._executor is executor:
+                        logger.error("Forecast pool broken, restarting workers")
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        self._executor = self._new_executor()
+                        self._recycles['broken'] += 1
+                    raise
+            finally:
+                self._in_flight -= 1
+            self._record(executor, memory)
+
+        if timings is not None:
+            timings['queue_wait'] = max(0.0, started - submitted)
+        return result
+
+    def _record(self, executor: ProcessPoolExecutor, memory: Dict) -> None:
+        """Track a worker's memory report and recycle the pool when due"""
+        pid = memory['pid']
+        worker = self._workers.pop(pid, {'jobs': 0})
+        self._workers[pid] = {**memory, 'jobs': worker['jobs'] + 1}
+        while len(self._workers) > 2 * self.max_workers:
+            self._workers.popitem(last=False)  # Workers of earlier generations
+        self._peak_rss = max(self._peak_rss, memory['peak_rss'])
+
+        if executor is not self._executor:
+            return  # Already recycled; this worker exits once its queue drains
+        self._generation_jobs += 1
+        if self.max_rss_bytes and memory['rss'] > self.max_rss_bytes:
+            self._recycle('rss', f"worker {pid} at {memory['rss'] / 2 ** 20:.0f} MiB RSS")
+        elif self.max_jobs_per_worker and self._generation_jobs >= self.max_jobs_per_worker * self.max_workers:
+            self._recycle('jobs', f"{self._generation_jobs} jobs")
+
+    def _recycle(self, reason: str, detail: str) -> None:
+        logger.info(f"Recycling forecast workers ({detail})")
+        old = self._executor
+        self._executor = self._new_executor()
+        old.shutdown(wait=False)  # Jobs already submitted to the old workers still complete
+        self._recycles[reason] += 1
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self._in_flight,
+            'queued': max(0, self._in_flight - self.max_workers),
+            'rejected': self._rejected,
+            'recycles': dict(self._recycles),
+            'memory': {
+                'peak_rss_bytes': self._peak_rss,  # High-water mark over all workers since start
+                'max_rss_bytes': self.max_rss_bytes or None,
+                'workers': [{'pid': pid, **report} for pid, report in self._workers.items()]
+            }
+        }
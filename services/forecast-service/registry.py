@@ -0,0 +1,147 @@
+"""
+Model registry for fitted Prophet models
+
+Fitted models are serialized (prophet.serialize JSON) to a local directory
+so a later request can extend or re-render a forecast without refitting.
+Models are keyed by (organizationId, domain, metric) plus a fingerprint of
+the training data; a small SQLite index tracks metadata and recency, and
+the least recently used models are evicted past FORECAST_MODEL_MAX.
+"""
+
+from typing import Dict, Optional, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def model_key(organization_id: str, domain: str, metric: Optional[str], data_fingerprint: str, model_version: str) -> str:
+    """URL-safe registry key for a model trained on a given series"""
+    identity = f"{organization_id}|{domain}|{metric or ''}|{data_fingerprint}|{model_version}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]
+
+
+class ModelRegistry:
+    """Filesystem store of serialized models with a SQLite index"""
+
+    def __init__(self, root: str, max_models: int):
+        self.root = root
+        self.max_models = max_models
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._loads = 0
+        self._evictions = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS models ('
+            ' key TEXT PRIMARY KEY, organization_id TEXT NOT NULL, domain TEXT NOT NULL,'
+            ' metric TEXT NOT NULL, data_fingerprint TEXT NOT NULL, data_points INTEGER NOT NULL,'
+            ' size_bytes INTEGER NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS models_series ON models (organization_id, domain, metric, created_at)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS models_last_used ON models (last_used_at)')
+        logger.info(f"Model registry at {root} (max {max_models} models)")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def save(self, key: str, model_json: str, info: Dict) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(model_json)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO models (key, organization_id, domain, metric, data_fingerprint,'
+                ' data_points, size_bytes, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, info['organization_id'], info['domain'], info.get('metric') or '',
+                 info['data_fingerprint'], info['data_points'], len(model_json), now, now)
+            )
+            self._saves += 1
+            self._evict()
+
+    def load(self, key: str) -> Optional[Tuple[str, Dict]]:
+        """Serialized model and its index entry, or None if unknown"""
+        info = self.describe(key)
+        if info is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                model_json = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._db.execute('DELETE FROM models WHERE key = ?', (key,))
+            return None
+        with self._lock:
+            self._db.execute('UPDATE models SET last_used_at = ? WHERE key = ?', (time.time(), key))
+            self._loads += 1
+        return model_json, info
+
+    def describe(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT key, organization_id, domain, metric, data_fingerprint, data_points,'
+                ' size_bytes, created_at, last_used_at FROM models WHERE key = ?',
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'key': row[0],
+            'organization_id': row[1],
+            'domain': row[2],
+            'metric': row[3] or None,
+            'data_fingerprint': row[4],
+            'data_points': row[5],
+            'size_bytes': row[6],
+            'created_at': row[7],
+            'last_used_at': row[8]
+        }
+
+    def latest(self, organization_id: str, domain: str, metric: Optional[str]) -> Optional[str]:
+        """Key of the most recently trained model for a series"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT key FROM models WHERE organization_id = ? AND domain = ? AND metric = ?'
+                ' ORDER BY created_at DESC LIMIT 1',
+                (organization_id, domain, metric or '')
+            ).fetchone()
+        return row[0] if row else None
+
+    def _evict(self) -> None:
+        """Drop least recently used models beyond max_models (caller holds the lock)"""
+        stale = self._db.execute(
+            'SELECT key FROM models ORDER BY last_used_at DESC LIMIT -1 OFFSET ?',
+            (self.max_models,)
+        ).fetchall()
+        for (key,) in stale:
+            self._db.execute('DELETE FROM models WHERE key = ?', (key,))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._evictions += 1
+
+    def close(self) -> None:
+        self._db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM models').fetchone()
+            return {
+                'models': count,
+                'bytes': size,
+                'saves': self._saves,
+                'loads': self._loads,
+                'evictions': self._evictions
+            }
@@ -0,0 +1,122 @@
+"""
+Exogenous regressors for Prophet forecasts
+
+Energy use follows weather (heating/cooling degree-days) and occupancy, so
+a forecast request can name regressor series that are passed to Prophet's
+add_regressor(). Each regressor must cover the history's dates and the
+forecast periods; it is aligned to them here, in the API process, and
+handed to the worker as a plain array.
+
+Series shared by many requests (a site's degree-days used by every metric
+at that site) can be uploaded once to the RegressorStore and referenced by
+id. They are kept normalized, so a batch does not resend or re-parse them.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import time
+
+import numpy as np
+
+import series
+
+
+class RegressorError(ValueError):
+    """Raised when a regressor cannot be aligned to the series it should explain"""
+
+
+class RegressorStore:
+    """In-memory LRU of normalized regressor series by id, with a TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict, Dict]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def put(self, regressor_id: str, history: Dict) -> Dict:
+        """Store a series.normalize()d regressor; returns its description"""
+        ds = series.dates(history)
+        info = {
+            'id': regressor_id,
+            'points': series.length(history),
+            'frequency': history['freq'],
+            'first': ds[0].isoformat() if len(ds) else None,
+            'last': ds[-1].isoformat() if len(ds) else None,
+            'digest': series.digest(history),
+            'stored_at': time.time()
+        }
+        self._entries.pop(regressor_id, None)
+        self._entries[regressor_id] = (time.time() + self.ttl_seconds, history, info)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return info
+
+    def _entry(self, regressor_id: str) -> Optional[Tuple[float, Dict, Dict]]:
+        entry = self._entries.get(regressor_id)
+        if entry is not None and entry[0] < time.time():
+            del self._entries[regressor_id]
+            entry = None
+        return entry
+
+    def get(self, regressor_id: str) -> Optional[Tuple[Dict, str]]:
+        """Normalized history and digest of a stored regressor, or None"""
+        entry = self._entry(regressor_id)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._entries.move_to_end(regressor_id)
+        return entry[1], entry[2]['digest']
+
+    def describe(self, regressor_id: str) -> Optional[Dict]:
+        entry = self._entry(regressor_id)
+        return entry[2] if entry is not None else None
+
+    def delete(self, regressor_id: str) -> bool:
+        return self._entries.pop(regressor_id, None) is not None
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self._hits,
+            'misses': self._misses
+        }
+
+
+def align(name: str, regressor: Dict, history: Dict, periods: int, how: str = 'mean') -> np.ndarray:
+    """
+    Regressor values at every history date followed by the next `periods`
+    forecast dates
+
+    A finer regressor (e.g. daily degree-days for a monthly series) is
+    resampled to the history's frequency first, with `how`.
+    """
+    if regressor['freq'] != history['freq']:
+        if not series.is_coarser(history['freq'], regressor['freq']):
+            raise RegressorError(
+                f"Regressor {name} is {regressor['freq']} but the series is {history['freq']}; "
+                "regressors must be at the series frequency or finer"
+            )
+        regressor = series.resample(regressor, history['freq'], how)
+
+    wanted = np.concatenate([
+        series.dates(history).to_numpy(dtype='datetime64[ns]'),
+        series.future_dates(history, periods).to_numpy(dtype='datetime64[ns]')
+    ])
+    available = series.dates(regressor).to_numpy(dtype='datetime64[ns]')
+    if not len(available):
+        raise RegressorError(f"Regressor {name} has no values")
+    positions = np.clip(np.searchsorted(available, wanted), 0, len(available) - 1)
+    found = available[positions] == wanted
+    if not found.all():
+        missing = wanted[~found]
+        raise RegressorError(
+            f"Regressor {name} has no value for {len(missing)} of the series and forecast dates "
+            f"(first missing: {str(missing[0])[:19]})"
+        )
+    values = regressor['values'][positions]
+    if not np.isfinite(values).all():
+        raise RegressorError(f"Regressor {name} has non-finite values")
+    return values
@@ -0,0 +1,28 @@
+"""
+Multi-horizon and what-if views of a single forecast
+
+A forecast for the longest requested horizon is sliced into every shorter
+horizon (its first h periods are exactly the h-period forecast), and
+scenarios rescale it: period t (1-based) of a scenario is the baseline
+times multiplier * (1 + growthPerPeriod) ** t. Bounds scale with the
+point forecast. All scenarios are computed in one broadcast.
+"""
+
+from typing import Dict, List, Sequence
+import numpy as np
+
+
+def factors(multipliers: Sequence[float], growth: Sequence[float], horizon: int) -> np.ndarray:
+    """Scenario adjustment per period (scenarios x horizon)"""
+    steps = np.arange(1, horizon + 1)
+    return np.asarray(multipliers, dtype=float)[:, None] * (1 + np.asarray(growth, dtype=float)[:, None]) ** steps
+
+
+def apply(forecast: Dict[str, np.ndarray], adjustment: np.ndarray) -> Dict[str, np.ndarray]:
+    """Baseline 'yhat'/'lower'/'upper' arrays (horizon,) adjusted per scenario (scenarios x horizon)"""
+    return {name: adjustment * values[None, :adjustment.shape[1]] for name, values in forecast.items() if len(values)}
+
+
+def slices(values: np.ndarray, horizons: List[int]) -> List[List[float]]:
+    """The first h values for every requested h"""
+    return [values[:h].tolist() for h in horizons]
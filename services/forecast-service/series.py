@@ -0,0 +1,224 @@
+"""
+Historical series payloads
+
+Requests carry history either as `historicalData` objects or as a compact
+columnar `history` block:
+
+    {"values": [...], "dates": ["2022-01-01", ...]}      # explicit dates
+    {"values": [...], "start": "2022-01-01", "freq": "MS"}  # regular grid
+
+Both are normalized once, in the API process, into NumPy arrays sorted by
+date. Everything downstream (fits, fast methods, cache keys, warm-start
+digests) works on these arrays instead of per-point Python objects.
+Normalized histories pickle cheaply into the process pool but are not
+JSON-serializable; use digest() to identify them.
+
+Hourly, daily, weekly and monthly series are supported. The frequency of
+explicit dates is detected from their median spacing, and long
+high-frequency histories can be resampled to a coarser frequency with
+resample() / bound_length().
+"""
+
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Canonical pandas alias -> (approximate seconds per period, seasonal period in steps)
+FREQUENCIES = {
+    'h': (3600, 24),
+    'D': (86400, 7),
+    'W-MON': (7 * 86400, 52),
+    'MS': (2629746, 12),
+}
+
+# Finest to coarsest; resampling only moves right
+FREQUENCY_LADDER = ('h', 'D', 'W-MON', 'MS')
+
+FREQUENCY_ALIASES = {
+    'h': 'h', 'H': 'h', 'hourly': 'h',
+    'D': 'D', 'daily': 'D',
+    'W': 'W-MON', 'W-MON': 'W-MON', 'weekly': 'W-MON',
+    'MS': 'MS', 'M': 'MS', 'ME': 'MS', 'monthly': 'MS',
+}
+
+
+class SeriesError(ValueError):
+    """Raised when a history payload cannot be interpreted"""
+
+
+def canonical_frequency(freq: str) -> str:
+    try:
+        return FREQUENCY_ALIASES[freq]
+    except KeyError:
+        raise SeriesError(f"Unsupported frequency {freq!r} (use one of: hourly, daily, weekly, monthly)")
+
+
+def detect_frequency(ds: np.ndarray) -> str:
+    """Supported frequency closest (in log scale) to the median spacing of sorted dates"""
+    if len(ds) < 2:
+        return 'MS'
+    spacing = float(np.median(np.diff(ds.astype('datetime64[s]').astype(np.int64))))
+    if spacing <= 0:
+        raise SeriesError("history dates must not all be equal")
+    return min(FREQUENCIES, key=lambda f: abs(np.log(spacing / FREQUENCIES[f][0])))
+
+
+def normalize(
+    values: Sequence[float],
+    dates: Optional[Sequence[str]] = None,
+    start: Optional[str] = None,
+    freq: Optional[str] = None
+) -> Dict:
+    """
+    Normalized history from either explicit dates or a start/freq grid
+
+    `freq` defaults to monthly for start grids and is detected for
+    explicit dates.
+    """
+    y = np.asarray(values, dtype=float)
+
+    if dates is not None:
+        if len(dates) != len(y):
+            raise SeriesError("dates and values must have the same length")
+        try:
+            ds = pd.to_datetime(pd.Index(dates))
+        except (ValueError, TypeError) as e:
+            raise SeriesError(f"Invalid date in history: {str(e)}")
+        if ds.tz is not None:
+            ds = ds.tz_convert(None)
+        ds = ds.to_numpy(dtype='datetime64[ns]')
+        if len(ds) > 1 and not (ds[1:] >= ds[:-1]).all():
+            order = np.argsort(ds, kind='stable')
+            ds, y = ds[order], y[order]
+        freq = canonical_frequency(freq) if freq else detect_frequency(ds)
+        return {'values': y, 'dates': ds, 'start': None, 'freq': freq, 'resampled_from': None}
+
+    if start is None:
+        raise SeriesError("history needs either dates or a start date")
+    try:
+        start_ts = pd.Timestamp(start)
+    except (ValueError, TypeError) as e:
+        raise SeriesError(f"Invalid start in history: {str(e)}")
+    if start_ts.tz is not None:
+        start_ts = start_ts.tz_convert(None)
+    return {
+        'values': y,
+        'dates': None,
+        'start': start_ts.isoformat(),
+        'freq': canonical_frequency(freq or 'MS'),
+        'resampled_from': None
+    }
+
+
+def length(history: Dict) -> int:
+    return len(history['values'])
+
+
+def season_length(history: Dict) -> int:
+    """Seasonal period in steps (24 hourly, 7 daily, 52 weekly, 12 monthly)"""
+    return FREQUENCIES[history['freq']][1]
+
+
+def describe(history: Dict) -> Dict:
+    """Frequency fields reported in response metadata"""
+    return {'frequency': history['freq'], 'resampled_from': history.get('resampled_from')}
+
+
+def is_coarser(freq: str, than: str) -> bool:
+    return FREQUENCY_LADDER.index(freq) > FREQUENCY_LADDER.index(than)
+
+
+def resample(history: Dict, freq: str, how: str = 'sum') -> Dict:
+    """
+    Aggregate a history to a coarser frequency, vectorized
+
+    Points are binned by period start ('sum' or 'mean' per bin). Partial
+    periods at either end (fewer points than the median bin) are dropped
+    so a half-observed first or last day does not look like a dip.
+    """
+    if history['freq'] == freq:
+        return history
+    if not is_coarser(freq, history['freq']):
+        raise SeriesError(f"Cannot resample {history['freq']} data to the finer frequency {freq}")
+
+    ds = dates(history).to_numpy(dtype='datetime64[ns]')
+    if freq == 'D':
+        bins = ds.astype('datetime64[D]')
+    elif freq == 'W-MON':
+        days = ds.astype('datetime64[D]').astype(np.int64)
+        bins = (days - (days + 3) % 7).astype('datetime64[D]')  # 1970-01-01 was a Thursday
+    else:
+        bins = ds.astype('datetime64[M]').astype('datetime64[D]')
+
+    labels, inverse, counts = np.unique(bins, return_inverse=True, return_counts=True)
+    totals = np.bincount(inverse, weights=history['values'], minlength=len(labels))
+    values = totals if how == 'sum' else totals / counts
+
+    keep = np.ones(len(labels), dtype=bool)
+    if len(labels) > 2:
+        typical = np.median(counts)
+        keep[0] = counts[0] >= typical
+        keep[-1] = counts[-1] >= typical
+
+    return {
+        'values': values[keep],
+        'dates': labels[keep].astype('datetime64[ns]'),
+        'start': None,
+        'freq': freq,
+        'resampled_from': history.get('resampled_from') or history['freq']
+    }
+
+
+def bound_length(history: Dict, max_points: int, how: str = 'sum') -> Dict:
+    """Resample to successively coarser frequencies until at most max_points remain"""
+    while length(history) > max_points and history['freq'] != FREQUENCY_LADDER[-1]:
+        coarser = FREQUENCY_LADDER[FREQUENCY_LADDER.index(history['freq']) + 1]
+        history = resample(history, coarser, how)
+    return history
+
+
+def dates(history: Dict) -> pd.DatetimeIndex:
+    if history['dates'] is not None:
+        return pd.DatetimeIndex(history['dates'])
+    return pd.date_range(history['start'], periods=length(history), freq=history['freq'])
+
+
+def future_dates(history: Dict, periods: int) -> pd.DatetimeIndex:
+    """The `periods` dates after the history, as make_future_dataframe() builds them"""
+    last = dates(history)[-1]
+    future = pd.date_range(last, periods=periods + 1, freq=history['freq'])
+    return future[future > last][:periods]
+
+
+def frame(history: Dict) -> pd.DataFrame:
+    """Prophet training frame (ds, y)"""
+    return pd.DataFrame({'ds': dates(history), 'y': history['values']})
+
+
+def head(history: Dict, n: int) -> Dict:
+    """The first n points (in time order)"""
+    return {
+        **history,
+        'values': history['values'][:n],
+        'dates': history['dates'][:n] if history['dates'] is not None else None
+    }
+
+
+def digest(history: Dict, n: Optional[int] = None) -> str:
+    """
+    Content hash of the first n points (all by default)
+
+    Dates are hashed as int64 nanoseconds so explicit-date and start/freq
+    payloads of the same data hash identically.
+    """
+    n = length(history) if n is None else n
+    hasher = hashlib.sha256()
+    hasher.update(dates(history)[:n].asi8.tobytes())
+    hasher.update(np.ascontiguousarray(history['values'][:n], dtype=float).tobytes())
+    return hasher.hexdigest()
+
+
+def date_keys(history: Dict, start_index: int = 0) -> List[str]:
+    """ISO timestamps of points from start_index on (matches fit-state dates)"""
+    return [ts.isoformat() for ts in dates(history)[start_index:]]
@@ -0,0 +1,131 @@
+"""
+Warm-start state for incremental refits
+
+After each fit we keep, per (organizationId, domain, metric), the fitted
+Stan parameters, a digest of the history that produced them and a
+forecast that runs a little past the requested horizon. The next request
+for the same series either:
+
+- seeds Prophet's optimizer with the stored parameters (warm start), or
+- when only a few points were appended and all of them fall inside the
+  previous prediction interval, is answered from the stored forecast
+  without refitting at all (opt-in via skipRefitWithinInterval).
+"""
+
+from typing import Dict, Optional
+
+from fast_methods import build_payload
+import series
+
+
+def state_key(request: Dict) -> Optional[str]:
+    """Warm-start identity of a series; None when the caller sent no metric"""
+    if not request.get('metric'):
+        return None
+    key = f"{request['organizationId']}|{request['domain']}|{request['metric']}"
+    if request.get('regressors'):
+        # Parameters of a model with other regressors do not fit this one
+        key += '|' + ','.join(r['name'] for r in request['regressors'])
+    return key
+
+
+def build_state(request: Dict, fit_state: Dict, previous: Optional[Dict]) -> Dict:
+    """Persistable warm-start state from a worker's fit state"""
+    fit_seconds = fit_state['fit_seconds']
+    if fit_state['warm_started'] and previous is not None:
+        # Keep the cold-fit baseline so savings stay comparable over time
+        cold_fit_seconds = previous.get('cold_fit_seconds', fit_seconds)
+        cold_iterations = previous.get('cold_iterations')
+    else:
+        cold_fit_seconds = fit_seconds
+        cold_iterations = fit_state['iterations']
+
+    return {
+        'params': fit_state['params'],
+        'forecast': fit_state['forecast'],
+        'history_points': series.length(request['history']),
+        'history_digest': series.digest(request['history']),
+        'cold_fit_seconds': cold_fit_seconds,
+        'cold_iterations': cold_iterations
+    }
+
+
+def fit_metadata(fit_state: Dict, previous: Optional[Dict]) -> Dict:
+    """Response metadata describing how the fit was started and what it saved"""
+    baseline = previous.get('cold_fit_seconds') if previous else None
+    cold_iterations = previous.get('cold_iterations') if previous else None
+    return {
+        'mode': 'warm' if fit_state['warm_started'] else 'cold',
+        'fit_seconds': round(fit_state['fit_seconds'], 4),
+        'iterations': fit_state['iterations'],
+        'baseline_fit_seconds': round(baseline, 4) if baseline is not None else None,
+        'baseline_iterations': cold_iterations,
+        'saved_seconds': round(baseline - fit_state['fit_seconds'], 4)
+        if fit_state['warm_started'] and baseline is not None else 0.0
+    }
+
+
+def try_skip_refit(request: Dict, state: Dict) -> Optional[Dict]:
+    """
+    Serve a request from the stored forecast if the series has not drifted
+
+    Returns a ForecastResponse-shaped dict, or None when a refit is needed:
+    the stored history must be an exact prefix of the new one, every
+    appended point must lie inside the stored prediction interval, and the
+    stored forecast must still cover the requested horizon.
+    """
+    history = request['history']
+    horizon = request['monthsToForecast']
+    previous_points = state['history_points']
+    n_points = series.length(history)
+
+    if n_points < previous_points:
+        return None
+    if series.digest(history, previous_points) != state['history_digest']:
+        return None
+
+    stored = state['forecast']
+    index = {date: i for i, date in enumerate(stored['dates'])}
+
+    last_position = -1
+    appended = zip(series.date_keys(history, previous_points), history['values'][previous_points:])
+    for date, value in appended:
+        position = index.get(date)
+        if position is None or position <= last_position:
+            return None
+        if not stored['lower'][position] <= value <= stored['upper'][position]:
+            return None
+        last_position = position
+
+    start = last_position + 1
+    end = start + horizon
+    if end > len(stored['dates']):
+        return None
+
+    intervals = request.get('intervals', 'sampling')
+    result = build_payload(
+        'prophet',
+        stored['yhat'][start:end],
+        stored['lower'][start:end],
+        stored['upper'][start:end],
+        trend_last=stored['trend'][end - 1],
+        yearly_last=stored['yearly'][end - 1] if stored.get('yearly') else 0.0,
+        y=history['values'],
+        horizon=horizon,
+        domain=request['domain'],
+        organization_id=request['organizationId'],
+        # Intervals come from the stored fit, whatever mode produced them
+        interval_mode='none' if intervals == 'none' else stored.get('interval_mode', 'sampling'),
+        **series.describe(history)
+    )
+    result['metadata']['warm_start'] = {
+        'mode': 'skipped_refit',
+        'fit_seconds': 0.0,
+        'iterations': 0,
+        'baseline_fit_seconds': round(state['cold_fit_seconds'], 4),
+        'baseline_iterations': state.get('cold_iterations'),
+        'saved_seconds': round(state['cold_fit_seconds'], 4),
+        'appended_points': n_points - previous_points
+    }
+    return result
+